@@ -19,53 +19,199 @@ Usage:
 4. Enter wallet password when prompted
 5. Confirm transfers if balance is sufficient
 
+Unattended run: KASPA_WALLET_PW=... python3 kaspa_batch.py --network testnet --wallet kaspa --yes
+
 Detailed logs are automatically saved to the logs directory.
 '''
 
+import argparse
 import subprocess
+import sys
 import time
 import logging
+import logging.handlers
+import queue
+import atexit
 import getpass
 import os
 import re
+import csv
+import io
+import json
+import functools
+import contextlib
+import mmap
+import random
+import bisect
+import select
+import shlex
+import shutil
+import tempfile
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from datetime import datetime
+from decimal import Decimal
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Moteur RE2 (temps linéaire, sans retour arrière) pour l'analyse des sorties longues s'il est installé
+try:
+    import re2 as outcome_re
+except ImportError:
+    outcome_re = re
 
 # Ajout de la configuration pour l'API Kaspa
 API_BASE_URL = "https://api.kaspa.org"
+API_TIMEOUT = 15                 # Délai maximum d'une requête API (secondes)
+API_RETRY_TOTAL = 3              # Nombre de nouvelles tentatives gérées par l'adaptateur HTTP
+API_RETRY_BACKOFF = 1            # Facteur de backoff exponentiel entre les tentatives
 
 # Configuration
 REDISTRIBUTION_FILE = "redistribution.txt"
+REDISTRIBUTION_FOOTER = "End of redistribution report"  # Ligne de fin du fichier de redistribution
+MMAP_MIN_FILE_SIZE = 8 * 1024 * 1024  # Taille à partir de laquelle le fichier est lu via mmap (octets)
 # Paramètres pour la vérification des transactions
 TRANSACTION_CHECK_INTERVAL = 10  # Vérifier toutes les 10 secondes
 TRANSACTION_CHECK_TIMEOUT = 60   # Vérifier pendant 60 secondes maximum
+TRANSACTION_CHECK_INITIAL_DELAY = 5  # Délai avant la première vérification d'une transaction
+VERIFY_MAX_WORKERS = 8           # Nombre de vérifications de transactions en parallèle
+VERIFY_JITTER = 0.5              # Variation aléatoire (±50%) de l'intervalle entre deux vérifications
+VERIFY_BACKOFF_FACTOR = 1.5      # Croissance de l'intervalle entre deux vérifications
+VERIFY_MAX_INTERVAL = 20         # Intervalle maximum entre deux vérifications (secondes)
+SOMPI_PER_KAS = 100_000_000      # 1 KAS = 10^8 sompi
+AMOUNT_TOLERANCE_SOMPI = 20_000_000  # Tolérance sur le montant reçu (0.2 KAS pour les frais)
+FEES_ESTIMATE_SOMPI = 2036       # Transaction fee estimate per transaction (0.00002036 KAS)
 # Paramètres pour les retries de transfert
 TRANSFER_RETRY_ATTEMPTS = 3      # Nombre maximum de tentatives
 TRANSFER_RETRY_DELAY = 5         # Délai en secondes entre les tentatives
+ERROR_DETAILS_MAX = 20           # Erreurs détaillées gardées pour le résumé; les suivantes sont seulement comptées (détail dans le log)
+# Paramètres pour les retries de connexion au nœud (backoff exponentiel)
+CONNECT_RETRY_ATTEMPTS = 6       # Nombre maximum de tentatives de connexion
+CONNECT_RETRY_BASE_DELAY = 0.5   # Délai avant la première nouvelle tentative (secondes)
+CONNECT_RETRY_MAX_DELAY = 10     # Délai maximum entre deux tentatives (secondes)
+CONNECT_RETRY_JITTER = 0.25      # Variation aléatoire ajoutée au délai (secondes)
+INTER_SEND_DELAY = 0.2           # Attente maximale en secondes du repos du CLI entre deux transferts
+# Paramètres pour l'attente des réponses du CLI dans tmux
+PANE_POLL_MIN_INTERVAL = 0.02    # Premier intervalle de vérification (secondes)
+PANE_POLL_MAX_INTERVAL = 0.25    # Intervalle maximum entre deux vérifications (secondes)
+PANE_OUTPUT_WAIT_MAX = 1.0       # Attente maximale d'une nouvelle sortie du terminal avant recapture (secondes)
+PANE_IDLE_TIME = 0.1             # Durée sans nouvelle sortie pour considérer le CLI au repos (secondes)
+PASSWORD_PROMPT_SETTLE = 0.5     # Pause après une invite de mot de passe, avant de taper le mot de passe (secondes)
+PASSWORD_PROMPT_SETTLE_MAX = 0.5 # Attente maximale du repos du CLI après une invite de mot de passe (secondes)
+PAYMENT_STEP_WAIT_MAX = 30       # Attente maximale de l'invite de paiement ou du début de l'envoi après le mot de passe (secondes)
+SEND_RESULT_WAIT_MAX = 30        # Attente maximale du résultat d'un envoi (IDs de transaction ou erreur) après les mots de passe (secondes)
+CLI_OUTPUT_QUIET_TIME = 0.5      # Durée sans nouvelle sortie pour considérer une réponse complète du CLI (secondes)
+WALLET_LIST_WAIT_MAX = 3         # Attente maximale de la fin de la liste des portefeuilles (secondes)
+BALANCE_OUTPUT_WAIT_MAX = 2      # Attente maximale de l'affichage du solde (secondes)
+TMUX_PASSWORD_BUFFER = "kaspa_batch_pw"  # Buffer tmux temporaire utilisé pour coller les mots de passe
+PROGRESS_REFRESH_INTERVAL = 0.1  # Intervalle minimum entre deux affichages de la barre de progression (secondes)
+
+# Variables d'environnement lues par défaut pour les mots de passe, avant de les demander
+WALLET_PASSWORD_ENV = "KASPA_WALLET_PW"
+PAYMENT_PASSWORD_ENV = "KASPA_PAYMENT_PW"
 
 # Log configuration
 LOG_DIRECTORY = "logs"
-if not os.path.exists(LOG_DIRECTORY):
-    os.makedirs(LOG_DIRECTORY)
+LOG_FILENAME = None  # Set by configure_logging() when the script is run
+CONSOLE_HANDLER = None  # Set by configure_logging(), quieted while the progress bar is shown
+LOG_FILE_LEVEL = logging.DEBUG  # Level of the log file (logging.INFO skips the pane dumps entirely)
 
-LOG_FILENAME = os.path.join(LOG_DIRECTORY, f"kaspa_transfers_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log")
+logger = logging.getLogger()
 
-# Configure loggers - one for file (with all details) and one for console (with less details)
-# File logger - logs everything including DEBUG messages
-file_handler = logging.FileHandler(LOG_FILENAME)
-file_handler.setLevel(logging.DEBUG)
-file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+def create_api_session():
+    """Crée la session HTTP partagée (connexions keep-alive réutilisées, retries avec backoff dans l'adaptateur)"""
+    retry = Retry(
+        total=API_RETRY_TOTAL,
+        backoff_factor=API_RETRY_BACKOFF,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=["GET", "POST"],  # POST seulement pour la recherche de transactions, sans effet de bord
+        respect_retry_after_header=True  # Sur 429/503, attendre le délai demandé par l'API
+    )
+    # Un seul hôte (api.kaspa.org); une connexion conservée par vérification parallèle,
+    # pour que les threads de vérification n'ouvrent pas de connexions jetables au-delà du pool
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=VERIFY_MAX_WORKERS, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.headers.update({"Connection": "keep-alive", "Accept-Encoding": "gzip"})
+    return session
 
-# Console handler - only logs INFO and above
-console_handler = logging.StreamHandler()
-console_handler.setLevel(logging.INFO)
-console_handler.setFormatter(logging.Formatter('%(message)s'))
+# Session unique pour tous les appels à l'API Kaspa
+API_SESSION = create_api_session()
 
-# Configure root logger
-logger = logging.getLogger()
-logger.setLevel(logging.DEBUG)  # Set to DEBUG to capture all messages
-logger.addHandler(file_handler)
-logger.addHandler(console_handler)
+def configure_logging():
+    """Creates the log file and attaches the file and console handlers, returns the log file path"""
+    global CONSOLE_HANDLER
+    # Only create the directory and the file when the script actually runs, not on import
+    os.makedirs(LOG_DIRECTORY, exist_ok=True)
+    log_filename = os.path.join(LOG_DIRECTORY, f"kaspa_transfers_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log")
+    
+    # Configure loggers - one for file (with all details) and one for console (with less details)
+    # File logger - logs everything including DEBUG messages (by default)
+    file_handler = logging.FileHandler(log_filename)
+    file_handler.setLevel(LOG_FILE_LEVEL)
+    file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+    
+    # File writes go through a queue drained by a background thread, off the CLI polling path
+    # The console handler stays synchronous so messages keep their order with print() and input()
+    log_queue = queue.Queue(-1)
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.setLevel(LOG_FILE_LEVEL)
+    log_listener = logging.handlers.QueueListener(log_queue, file_handler, respect_handler_level=True)
+    log_listener.start()
+    atexit.register(log_listener.stop)  # Flush the remaining records on exit
+    
+    # Console handler - only logs INFO and above, on stdout like print() so status messages need a single call
+    console_handler = logging.StreamHandler(sys.stdout)
+    console_handler.setLevel(logging.INFO)
+    console_handler.setFormatter(logging.Formatter('%(message)s'))
+    
+    # Configure root logger: lowest level of the two handlers, so disabled DEBUG messages are never formatted
+    logger.setLevel(min(LOG_FILE_LEVEL, logging.INFO))
+    logger.addHandler(queue_handler)
+    logger.addHandler(console_handler)
+    CONSOLE_HANDLER = console_handler
+    
+    return log_filename
+
+@contextlib.contextmanager
+def console_quieted(level=logging.ERROR):
+    """
+    Raises the console handler level for the duration of the block; the log file still gets every message.
+    Messages still shown start on a new line, so they are not appended to the progress line being redrawn.
+    """
+    previous_level = CONSOLE_HANDLER.level
+    previous_formatter = CONSOLE_HANDLER.formatter
+    CONSOLE_HANDLER.setLevel(level)
+    CONSOLE_HANDLER.setFormatter(logging.Formatter('\n%(message)s'))
+    try:
+        yield
+    finally:
+        CONSOLE_HANDLER.setLevel(previous_level)
+        CONSOLE_HANDLER.setFormatter(previous_formatter)
+
+def draw_progress(done, total, failed, last_draw=0.0, final=False):
+    """
+    Redraws the transfer progress line in place, at most every PROGRESS_REFRESH_INTERVAL seconds
+    unless final, which also ends the line. Returns the time of the last draw.
+    """
+    now = time.time()
+    if not final and now - last_draw < PROGRESS_REFRESH_INTERVAL:
+        return last_draw
+    width = 30
+    filled = width * done // total
+    sys.stdout.write(f"\r📤 [{'#' * filled}{'.' * (width - filled)}] {done}/{total} tx, {failed} failed")
+    if final:
+        sys.stdout.write("\n")
+    sys.stdout.flush()
+    return now
+
+def ui(msg, level=logging.INFO):
+    """Shows a status message on the console and records it in the log file, through the logger handlers"""
+    if msg.startswith("\n"):
+        print()  # Ligne vide sur la console seulement, pas dans le fichier de log
+        msg = msg[1:]
+    logger.log(level, msg)
 
 # Network-specific configuration
 NETWORK_CONFIGS = {
@@ -83,105 +229,225 @@ NETWORK_CONFIGS = {
     }
 }
 
+def build_balance_patterns(currency_symbol):
+    """Builds the compiled regex patterns used to extract the wallet balance"""
+    symbol = re.escape(currency_symbol)
+    number = r'([\d,]+(?:\.\d+)?)'
+    # Un pattern par format, essayés dans l'ordre: le premier format trouvé l'emporte, quelle que soit
+    # sa position dans le terminal (le solde du compte de 'list' avant les montants d'autres lignes)
+    # Note: [\d,]+ capture les chiffres avec ou sans virgules comme séparateurs de milliers
+    return [
+        # Format de la commande list: "w0111 [30d92145]: 6,007 KAS"
+        re.compile(r':\s*' + number + r'\s*' + symbol),
+        # Format standard: "• 123.456 KAS" ou "• 6,007 KAS"
+        re.compile(r'•\s*' + number + r'\s*' + symbol),
+        # Format balance: "Balance: 123.456 KAS"
+        re.compile(r'[Bb]alance[:]?\s*' + number + r'\s*' + symbol),
+        # Format avec parenthèses: "(123.456 KAS)" ou "(6,007 KAS)"
+        re.compile(r'\(\s*' + number + r'\s*' + symbol + r'\)'),
+        # Format générique: tout nombre suivi du symbole de devise
+        re.compile(number + r'\s*' + symbol)
+    ]
+
+# Transfer outcome markers in the CLI output, matched in a single pass
+# Only "error" is case-insensitive, like the original checks
+TRANSFER_OUTCOME_PATTERN = outcome_re.compile(
+    r'(?P<sending>Sending)|(?P<tx_ids>tx ids:)|(?P<insufficient_funds>Insufficient funds)'
+    r'|(?P<invalid_address>invalid address)|(?P<network_error>network error)|(?P<error>(?i:error))'
+)
+
+# Transaction IDs printed by the CLI after "tx ids:", one per line
+TRANSACTION_ID_PATTERN = re.compile(r'\b[0-9a-f]{64}\b')
+
+# Wallet-wide lack of funds in a transfer error, matched without lowercasing the message
+GLOBAL_FUNDS_ERROR_PATTERN = re.compile(r'not enough funds', re.IGNORECASE)
+
+# Error type counted in the summary for a free-form CLI error line (the line itself is kept in the details)
+CLI_ERROR_KIND = "Erreur CLI"
+
+# Plain decimal amount as accepted in the redistribution file (sign allowed so negatives get a clear message)
+AMOUNT_PATTERN = re.compile(r'[+-]?(?:[0-9]+(?:\.[0-9]*)?|\.[0-9]+)')
+
+# Network name for each known address prefix, used to validate addresses in one lookup
+ADDRESS_PREFIX_NETWORKS = {config["address_prefix"]: network for network, config in NETWORK_CONFIGS.items()}
+
+# Balance patterns compiled once per currency symbol at import time
+BALANCE_PATTERNS = {
+    config["currency_symbol"]: build_balance_patterns(config["currency_symbol"])
+    for config in NETWORK_CONFIGS.values()
+}
+
 # Fonctions pour vérifier les transactions
-def get_transactions(address, limit=50, max_retries=3):
-    """Récupère les transactions pour une adresse avec mécanisme de retry."""
-    retry_count = 0
-    
-    while retry_count < max_retries:
-        try:
-            url = f"{API_BASE_URL}/addresses/{address}/full-transactions"
-            params = {
-                "limit": limit,
-                "resolve_previous_outpoints": "light"
-            }
-            
-            response = requests.get(url, params=params, timeout=15)
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            retry_count += 1
-            logger.warning(f"Erreur API (tentative {retry_count}/{max_retries}): {e}")
-            if retry_count < max_retries:
-                # Backoff exponentiel
-                sleep_time = 2 ** retry_count
-                time.sleep(sleep_time)
-            else:
-                logger.error(f"Échec API après {max_retries} tentatives")
-                return []
-    
-    return []
+def get_transactions(address, limit=50):
+    """Récupère les transactions pour une adresse (les retries sont gérés par l'adaptateur de la session)."""
+    try:
+        url = f"{API_BASE_URL}/addresses/{address}/full-transactions"
+        params = {
+            "limit": limit,
+            "resolve_previous_outpoints": "light"
+        }
+        
+        response = API_SESSION.get(url, params=params, timeout=API_TIMEOUT)
+        response.raise_for_status()
+        return response.json()
+    except requests.exceptions.RequestException as e:
+        logger.error(f"Échec API après {API_RETRY_TOTAL} nouvelles tentatives: {e}")
+        return []
 
-def has_received_exact_amount(address, expected_amount, transactions):
+def get_accepted_transaction_ids(tx_ids):
     """
-    Vérifie si l'adresse a reçu le montant attendu dans l'une de ses transactions récentes.
-    Utilise un arrondi à une décimale et une tolérance pour accommoder les frais.
+    Recherche un lot de transactions par ID en une seule requête à l'API.
+    Retourne l'ensemble des IDs acceptés, ou None si l'API n'a pas pu répondre.
     """
     try:
-        # Convertir le montant attendu
-        expected_amount_float = float(expected_amount)
-        expected_amount_rounded = round(expected_amount_float, 1)
-        
-        # Tolérance augmentée pour les frais (0.2 KAS au lieu de 0.1)
-        min_acceptable = expected_amount_rounded - 0.2
-        
-        logger.debug(f"Recherche de paiement pour {address}: attendu {expected_amount_rounded} KAS (min {min_acceptable} KAS)")
-        
-        for tx in transactions:
-            # Ignorer les transactions non acceptées
-            if not tx.get("is_accepted", False):
-                continue
-            
-            # Vérifier les sorties de la transaction pour voir si le montant correspond
-            for output in tx.get("outputs", []):
-                if output.get("script_public_key_address") == address:
-                    # Convertir sompi en KAS (1 KAS = 10^8 sompi)
-                    received_amount = output.get("amount", 0) / 1e8
-                    received_amount_rounded = round(received_amount, 1)
-                    
-                    logger.debug(f"Montant trouvé: {received_amount_rounded} KAS")
-                    
-                    # Vérification avec tolérance accrue pour les frais
-                    if received_amount_rounded >= min_acceptable and received_amount_rounded <= (expected_amount_rounded + 0.2):
-                        logger.debug(f"✅ Montant valide trouvé: {received_amount_rounded} KAS (attendu: {expected_amount_rounded} KAS)")
-                        return True
+        url = f"{API_BASE_URL}/transactions/search"
+        params = {
+            "fields": "transaction_id,is_accepted",
+            "resolve_previous_outpoints": "no"
+        }
         
-        logger.debug(f"❌ Aucun montant valide trouvé pour {address}")
-        return False
+        response = API_SESSION.post(url, params=params, json={"transactionIds": list(tx_ids)}, timeout=API_TIMEOUT)
+        response.raise_for_status()
+        return {tx["transaction_id"] for tx in response.json() if tx.get("is_accepted", False)}
+    except requests.exceptions.RequestException as e:
+        logger.error(f"Échec de la recherche des transactions par ID: {e}")
+        return None
+
+def index_received_amounts(transactions, received, addresses, claimed):
+    """
+    Ajoute en une seule passe les montants reçus (en sompi) par les adresses suivies dans les transactions acceptées.
+    received associe chaque adresse à la liste de ses (montant reçu, clé de sortie), la clé étant (ID de transaction, index).
+    Les autres sorties (monnaie rendue, destinataires déjà vérifiés) sont ignorées, de même que celles de claimed:
+    IDs des transactions et clés des sorties déjà attribuées à un transfert vérifié.
+    """
+    for tx in transactions:
+        # Ignorer les transactions non acceptées
+        if not tx.get("is_accepted", False):
+            continue
+        tx_id = tx.get("transaction_id")
+        if tx_id in claimed:
+            continue
         
-    except Exception as e:
-        logger.error(f"Erreur lors de la vérification du montant: {e}")
-        return False
+        for position, output in enumerate(tx.get("outputs", ())):
+            address = output.get("script_public_key_address")
+            output_key = (tx_id, output.get("index", position))
+            if address in addresses and output_key not in claimed:
+                received[address].append((int(output.get("amount", 0)), output_key))
+
+def take_received_amount(received, address, expected_sompi):
+    """
+    Cherche le montant attendu (en sompi) parmi les montants reçus par l'adresse, d'après l'index trié des montants reçus.
+    Utilise une tolérance de 0.2 KAS pour accommoder les frais.
+    La sortie trouvée est retirée de l'index pour ne valider qu'un seul transfert; retourne sa clé, ou None.
+    """
+    amounts = received.get(address)
+    if not amounts:
+        return None
+    # Premier montant reçu >= borne basse, puis contrôle de la borne haute
+    position = bisect.bisect_left(amounts, (expected_sompi - AMOUNT_TOLERANCE_SOMPI,))
+    if position < len(amounts) and amounts[position][0] <= expected_sompi + AMOUNT_TOLERANCE_SOMPI:
+        return amounts.pop(position)[1]
+    return None
 
-def verify_transaction_received(address, amount, max_wait_time=TRANSACTION_CHECK_TIMEOUT, check_interval=TRANSACTION_CHECK_INTERVAL):
+def verify_transactions_batch(pending, max_wait_time=TRANSACTION_CHECK_TIMEOUT, check_interval=TRANSACTION_CHECK_INTERVAL, initial_delay=0):
     """
-    Vérifie périodiquement si la transaction a été reçue par l'adresse cible avec backoff exponentiel.
-    Retourne True si la transaction est détectée, False sinon.
+    Vérifie périodiquement la réception d'un lot de transactions avec backoff exponentiel.
+    pending associe l'index du transfert à (adresse, montant, montant en sompi, ID de transaction ou None).
+    À chaque cycle, les transactions dont l'ID est connu sont recherchées ensemble en une requête; pour les autres
+    (ou si la recherche échoue), les transactions de chaque adresse sont récupérées une seule fois, en parallèle.
+    Une sortie reçue ne valide qu'un seul transfert, y compris d'un cycle à l'autre (plusieurs transferts
+    du même montant vers la même adresse).
+    Retourne l'ensemble des index dont la transaction a été détectée.
     """
-    logger.info(f"🔍 Vérifiant la réception de {amount} KAS par {address}...")
+    pending = dict(pending)
+    verified = set()
+    claimed = set()  # Transactions et sorties déjà attribuées à un transfert vérifié, voir index_received_amounts
+    
+    # Laisser le temps aux transactions d'être propagées avant la première vérification
+    if initial_delay:
+        time.sleep(initial_delay)
+    
+    logger.info(f"🔍 Vérifiant la réception de {len(pending)} transactions...")
     
     # Utiliser un backoff exponentiel pour les vérifications
     current_interval = check_interval
-    max_interval = 20  # Intervalle maximum entre les vérifications
     
     end_time = time.time() + max_wait_time
-    while time.time() < end_time:
-        # Récupérer les transactions récentes de l'adresse
-        transactions = get_transactions(address)
-        
-        # Vérifier si le montant attendu est présent
-        if has_received_exact_amount(address, amount, transactions):
-            logger.info(f"✅ Transaction vérifiée: {amount} KAS reçus par {address}")
-            return True
+    with ThreadPoolExecutor(max_workers=VERIFY_MAX_WORKERS) as pool:
+        while pending:
+            # Les transactions d'ID connu sont recherchées directement, en même temps que les adresses des autres
+            tx_ids = {tx_id for _, _, _, tx_id in pending.values() if tx_id}
+            search = pool.submit(get_accepted_transaction_ids, tx_ids) if tx_ids else None
             
-        # Calculer le temps d'attente avec backoff
-        sleep_time = min(current_interval, max_interval)
-        logger.debug(f"Transaction non détectée, nouvelle vérification dans {sleep_time} secondes...")
-        time.sleep(sleep_time)
-        current_interval *= 1.5  # Augmentation progressive
+            # Récupérer une seule fois les transactions récentes de chaque adresse en attente
+            # (une même adresse peut apparaître dans plusieurs transferts)
+            addresses = {address for address, _, _, tx_id in pending.values() if not tx_id}
+            futures = [pool.submit(get_transactions, address) for address in addresses]
+            
+            accepted = search.result() if search else set()
+            search_failed = accepted is None
+            if search_failed:
+                # Recherche par ID indisponible: vérifier aussi ces transactions par adresse pour ce cycle
+                accepted = set()
+                fallback = {address for address, _, _, tx_id in pending.values() if tx_id} - addresses
+                futures += [pool.submit(get_transactions, address) for address in fallback]
+                addresses |= fallback
+            
+            # Transferts retrouvés par ID d'abord: leur transaction ne peut plus valider un autre transfert par montant
+            for index, (address, amount, _, tx_id) in list(pending.items()):
+                if tx_id in accepted:
+                    claimed.add(tx_id)
+                    logger.info(f"✅ Transaction vérifiée: {amount} KAS reçus par {address}")
+                    verified.add(index)
+                    del pending[index]
+            
+            # Indexer les montants reçus de toutes les réponses, puis vérifier chaque transfert par recherche dichotomique
+            received = defaultdict(list)
+            for future in as_completed(futures):
+                index_received_amounts(future.result(), received, addresses, claimed)
+            for amounts in received.values():
+                amounts.sort()
+            
+            for index, (address, amount, expected_sompi, tx_id) in list(pending.items()):
+                if tx_id and not search_failed:
+                    continue  # Attendu par ID: ne pas prendre par montant la sortie d'un autre transfert
+                output_key = take_received_amount(received, address, expected_sompi)
+                if output_key is not None:
+                    claimed.add(output_key)
+                    logger.info(f"✅ Transaction vérifiée: {amount} KAS reçus par {address}")
+                    verified.add(index)
+                    del pending[index]
+            
+            # Dernière vérification faite à l'échéance: ne pas attendre davantage
+            if not pending or time.time() >= end_time:
+                break
+            
+            # Calculer le temps d'attente avec backoff, avec une variation aléatoire pour ne pas
+            # synchroniser les requêtes sur l'API (429), sans dépasser le délai total
+            sleep_time = current_interval * random.uniform(1 - VERIFY_JITTER, 1 + VERIFY_JITTER)
+            sleep_time = round(max(0, min(sleep_time, end_time - time.time())), 1)
+            logger.debug(f"{len(pending)} transactions non détectées, nouvelle vérification dans {sleep_time} secondes...")
+            time.sleep(sleep_time)
+            current_interval = min(current_interval * VERIFY_BACKOFF_FACTOR, VERIFY_MAX_INTERVAL)  # Augmentation progressive
     
-    logger.warning(f"⚠️ Transaction non détectée après {max_wait_time} secondes pour {address}")
-    return False
+    for address, _, _, _ in pending.values():
+        logger.warning(f"⚠️ Transaction non détectée après {max_wait_time} secondes pour {address}")
+    return verified
+
+def iter_file_lines(file_path):
+    """
+    Yields the lines of a text file, memory-mapping large files so they are paged in on demand.
+    A UTF-8 byte order mark (files saved by some spreadsheet editors) is dropped.
+    """
+    if os.path.getsize(file_path) < MMAP_MIN_FILE_SIZE:
+        with open(file_path, 'r', newline='', encoding='utf-8-sig') as file:
+            yield from file
+        return
+    
+    # Large airdrop lists: no full read into memory, each line is decoded only when reached
+    with open(file_path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        for raw_line in iter(mapped.readline, b''):
+            yield raw_line.decode('utf-8-sig')
 
 def read_redistribution_file(file_path, address_prefix):
     """Reads the redistribution file with enhanced validation"""
@@ -194,75 +460,77 @@ def read_redistribution_file(file_path, address_prefix):
         return []
             
     try:
-        with open(file_path, 'r') as file:
-            content = file.read()
-            
-            # Check global format
-            if "Address,Amount" not in content:
-                logger.error(f"❌ Incorrect file format: 'Address,Amount' header missing")
-                return []
-                
-            if "End of redistribution report" not in content:
-                logger.warning(f"⚠️ Suspicious file format: 'End of redistribution report' missing")
-            
-            # Line by line processing
-            reading_data = False
-            line_number = 0
+        # Single streaming pass: header and footer are detected while reading the rows
+        reading_data = False
+        footer_seen = False
+        
+        with contextlib.closing(iter_file_lines(file_path)) as lines:
+            reader = csv.reader(lines)
             
-            for line in content.splitlines():
-                line_number += 1
-                line = line.strip()
+            for row in reader:
+                line_number = reader.line_num
                 
-                if not line:  # Ignore empty lines
+                if not row:  # Ignore empty lines
                     continue
-                    
-                if "Address,Amount" in line:
-                    reading_data = True
+                
+                # State 1: before the header, only the header (or an early footer) is looked for
+                if not reading_data:
+                    if [field.strip() for field in row[:2]] == ["Address", "Amount"]:
+                        reading_data = True
+                    elif row[0].lstrip().startswith(REDISTRIBUTION_FOOTER):
+                        footer_seen = True
+                        break
                     continue
                 
-                if "End of redistribution report" in line:
+                # State 2: data rows until the footer
+                if row[0].lstrip().startswith(REDISTRIBUTION_FOOTER):
+                    footer_seen = True
                     break
                 
-                if reading_data and ',' in line:
-                    parts = line.split(',')
-                    if len(parts) >= 2:
-                        address = parts[0].strip()
-                        amount_str = parts[1].strip()
-                        
-                        # Address validation
-                        valid_address = False
-                        if address.startswith(address_prefix):
-                            valid_address = True
-                        elif not address.startswith("kaspa:") and not address.startswith("kaspatest:"):
-                            address = address_prefix + address
-                            valid_address = True
-                            logger.info(f"Prefix added to address: {address}")
-                        elif address.startswith("kaspa:") and address_prefix == "kaspatest:":
-                            logger.warning(f"⚠️ Line {line_number}: Mainnet address '{address}' found while network is testnet")
-                        elif address.startswith("kaspatest:") and address_prefix == "kaspa:":
-                            logger.warning(f"⚠️ Line {line_number}: Testnet address '{address}' found while network is mainnet")
-                        
-                        # Amount validation
-                        try:
-                            amount = float(amount_str)
-                            if amount <= 0:
-                                logger.warning(f"⚠️ Line {line_number}: Invalid amount (must be positive): {amount_str}")
-                                invalid_lines += 1
-                                continue
-                        except ValueError:
-                            logger.warning(f"⚠️ Line {line_number}: Non-numeric amount: {amount_str}")
-                            invalid_lines += 1
-                            continue
-                        
-                        if valid_address:
-                            transfers.append((address, amount_str))
-                            valid_lines += 1
-                        else:
-                            logger.warning(f"⚠️ Line {line_number}: Address ignored as incompatible with the network: {address}")
-                            invalid_lines += 1
+                if len(row) >= 2:
+                    address = row[0].strip()
+                    amount_str = row[1].strip()
+                    
+                    # Address validation: single prefix detection, then dispatch on the result
+                    detected_prefix = next((prefix for prefix in ADDRESS_PREFIX_NETWORKS if address.startswith(prefix)), None)
+                    valid_address = False
+                    if detected_prefix == address_prefix:
+                        valid_address = True
+                    elif detected_prefix is None:
+                        address = address_prefix + address
+                        valid_address = True
+                        logger.info(f"Prefix added to address: {address}")
                     else:
-                        logger.warning(f"⚠️ Line {line_number}: Incorrect format (should be 'address,amount'): {line}")
+                        address_network = ADDRESS_PREFIX_NETWORKS[detected_prefix].capitalize()
+                        logger.warning(f"⚠️ Line {line_number}: {address_network} address '{address}' found while network is {ADDRESS_PREFIX_NETWORKS[address_prefix]}")
+                    
+                    # Amount validation: the compiled pattern rejects bad values before the amount is parsed
+                    if not AMOUNT_PATTERN.fullmatch(amount_str):
+                        logger.warning(f"⚠️ Line {line_number}: Non-numeric amount: {amount_str}")
+                        invalid_lines += 1
+                        continue
+                    # Parsed once into integer sompi, exact for the totals and the verification
+                    amount_sompi = int((Decimal(amount_str) * SOMPI_PER_KAS).to_integral_value())
+                    if amount_sompi <= 0:
+                        logger.warning(f"⚠️ Line {line_number}: Invalid amount (must be positive): {amount_str}")
                         invalid_lines += 1
+                        continue
+                    
+                    if valid_address:
+                        # Keep the original string for the CLI and the sompi value for the totals and checks
+                        transfers.append((address, amount_str, amount_sompi))
+                        valid_lines += 1
+                    else:
+                        logger.warning(f"⚠️ Line {line_number}: Address ignored as incompatible with the network: {address}")
+                        invalid_lines += 1
+        
+        # Check global format
+        if not reading_data:
+            logger.error(f"❌ Incorrect file format: 'Address,Amount' header missing")
+            return []
+            
+        if not footer_seen:
+            logger.warning(f"⚠️ Suspicious file format: 'End of redistribution report' missing")
     
     except Exception as e:
         logger.error(f"❌ Error reading file: {e}")
@@ -273,84 +541,362 @@ def read_redistribution_file(file_path, address_prefix):
 
 def calculate_total_amount(transfers):
     """Calculates the total amount to transfer"""
-    total = 0.0
-    fees_estimate = 0.00002036  # Transaction fee estimate per transaction
+    # Amounts were already parsed into sompi by read_redistribution_file: exact integer sums
+    total_sompi = sum(amount_sompi for _, _, amount_sompi in transfers)
+    
+    total_with_fees_sompi = total_sompi + (len(transfers) * FEES_ESTIMATE_SOMPI)
+    return total_sompi / SOMPI_PER_KAS, total_with_fees_sompi / SOMPI_PER_KAS
+
+@functools.lru_cache(maxsize=None)
+def tmux_capture_argv(session_name):
+    """Returns the tmux capture-pane argv for a session, built once per session"""
+    return ("tmux", "capture-pane", "-p", "-t", session_name)
+
+@functools.lru_cache(maxsize=None)
+def tmux_send_keys_argv(session_name):
+    """Returns the tmux send-keys argv prefix for a session, built once per session"""
+    return ("tmux", "send-keys", "-t", session_name)
+
+def tmux_literal_argument(text):
+    """Escapes a trailing ';' that tmux would otherwise treat as a command separator"""
+    if text.endswith(";"):
+        return text[:-1] + "\\;"
+    return text
+
+# Clients tmux en mode contrôle (-C) persistants, un par session, pour piloter le terminal sans fork/exec
+TMUX_CONTROL_CLIENTS = {}
+
+def close_tmux_control_clients():
+    """Terminates the persistent tmux control-mode clients"""
+    for client in TMUX_CONTROL_CLIENTS.values():
+        if client.poll() is None:
+            client.terminate()
+            client.wait()
+    TMUX_CONTROL_CLIENTS.clear()
+
+atexit.register(close_tmux_control_clients)
+
+def read_tmux_control_reply(client):
+    """
+    Reads the next reply block (%begin ... %end or %error) of a command sent on a control-mode client.
+    Returns (output, failed).
+    """
+    lines = []
+    block_guard = None
+    while True:
+        line = client.stdout.readline()
+        if not line:
+            raise EOFError("tmux control client exited")
+        if block_guard is None:
+            # Ignorer les notifications (%output, %session-changed...) et les blocs non émis par ce client
+            if line.startswith(b"%begin ") and line.split()[-1] == b"1":
+                block_guard = line[len(b"%begin "):]
+        # Le bloc se termine par %end ou %error suivi des mêmes horodatage, numéro et drapeaux que %begin
+        elif line == b"%end " + block_guard:
+            return b"".join(lines), False
+        elif line == b"%error " + block_guard:
+            return b"".join(lines), True
+        else:
+            lines.append(line)
+
+def tmux_quote(text):
+    """Quotes an argument for the tmux command parser (single quotes, embedded quotes concatenated)"""
+    return "'" + text.replace("'", "'\"'\"'") + "'"
+
+def tmux_control_commands(session_name, *commands):
+    """
+    Runs tmux commands, one per line, on the persistent control-mode client of a session.
+    All lines are written at once; returns the output of the last command.
+    """
+    client = tmux_control_client(session_name)
+    client.stdin.write("".join(command + "\n" for command in commands).encode('utf-8'))
+    client.stdin.flush()
+    
+    # Une réponse par ligne, même en cas d'erreur: toutes sont lues pour rester synchronisé
+    replies = [read_tmux_control_reply(client) for _ in commands]
+    for command, (output, failed) in zip(commands, replies):
+        if failed:
+            raise subprocess.CalledProcessError(1, command.split(" ", 1)[0], output=output)
+    return replies[-1][0]
+
+def tmux_control_client(session_name):
+    """Returns the persistent control-mode client attached to a session, started on first use"""
+    client = TMUX_CONTROL_CLIENTS.get(session_name)
+    if client is not None and client.poll() is None:
+        return client
+    
+    client = subprocess.Popen(
+        ("tmux", "-C", "attach-session", "-t", session_name),
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL
+    )
+    TMUX_CONTROL_CLIENTS[session_name] = client
+    # Ne pas recevoir la sortie du terminal en notifications %output (tmux >= 3.2, sans effet sinon)
+    client.stdin.write(b"refresh-client -f no-output\n")
+    client.stdin.flush()
+    read_tmux_control_reply(client)
+    return client
+
+def discard_tmux_control_client(session_name):
+    """Forgets the control-mode client of a session after a failure, terminating it if still running"""
+    client = TMUX_CONTROL_CLIENTS.pop(session_name, None)
+    if client is not None and client.poll() is None:
+        client.terminate()
+
+def tmux_display(session_name, fmt, clear_history=False):
+    """Returns a tmux format such as '#{cursor_y}' expanded for the pane, optionally after clearing its scrollback"""
+    commands = ("clear-history",) if clear_history else ()
+    commands += (f"display-message -p {tmux_quote(fmt)}",)
+    try:
+        output = tmux_control_commands(session_name, *commands)
+    except (OSError, EOFError, subprocess.CalledProcessError):
+        discard_tmux_control_client(session_name)
+        argv = ("tmux",) + (("clear-history", "-t", session_name, ";") if clear_history else ())
+        output = subprocess.run(argv + ("display-message", "-p", "-t", session_name, fmt),
+                                check=True, stdout=subprocess.PIPE, close_fds=False).stdout
+    return output.decode('utf-8').strip()
+
+def pane_mark(session_name):
+    """
+    Returns the pane line of the cursor, where the next command is echoed, to capture only what follows (capture_pane since).
+    The scrollback is cleared first, so the line number stays valid however many transfers the pane has shown.
+    """
+    return int(tmux_display(session_name, "#{cursor_y}", clear_history=True))
+
+def capture_pane_bytes(session_name, joined=False, since=None):
+    """
+    Captures the visible content of the tmux pane as raw bytes.
+    With joined, lines wrapped by the pane width are joined back (capture-pane -J), so a long command echo stays on one line.
+    With since (a line from pane_mark), the capture starts at that line, even once it has scrolled into the scrollback.
+    """
+    options = " -J" if joined else ""
+    if since is not None:
+        options += f" -S {since - int(tmux_display(session_name, '#{history_size}'))}"
+    try:
+        return tmux_control_commands(session_name, "capture-pane -p" + options)
+    except (OSError, EOFError, subprocess.CalledProcessError):
+        # Client de contrôle indisponible: capture ponctuelle par un client tmux classique
+        discard_tmux_control_client(session_name)
+        argv = tmux_capture_argv(session_name) + tuple(options.split())
+        return subprocess.run(argv, check=True, stdout=subprocess.PIPE, close_fds=False).stdout
+
+def capture_pane(session_name, joined=False, since=None):
+    """Captures the visible content of the tmux pane"""
+    return capture_pane_bytes(session_name, joined, since).decode('utf-8')
+
+# Flux de sortie des terminaux (pipe-pane vers une FIFO), par session: (fd de lecture, fd d'écriture, dossier)
+PANE_OUTPUT_STREAMS = {}
+
+def close_pane_output_streams():
+    """Closes the pane output FIFOs and removes their temporary directories"""
+    for read_fd, write_fd, fifo_dir in PANE_OUTPUT_STREAMS.values():
+        os.close(read_fd)
+        os.close(write_fd)
+        shutil.rmtree(fifo_dir, ignore_errors=True)
+    PANE_OUTPUT_STREAMS.clear()
+
+atexit.register(close_pane_output_streams)
+
+def open_pane_output_stream(session_name):
+    """Streams the pane output into a FIFO with pipe-pane, so waits can block until the CLI prints something"""
+    fifo_dir = tempfile.mkdtemp(prefix="kaspa_batch_")
+    fifo_path = os.path.join(fifo_dir, "pane.out")
+    try:
+        os.mkfifo(fifo_path, 0o600)
+        read_fd = os.open(fifo_path, os.O_RDONLY | os.O_NONBLOCK)
+        # Descripteur d'écriture gardé ouvert: la lecture ne voit jamais de fin de fichier si 'cat' se termine
+        write_fd = os.open(fifo_path, os.O_WRONLY | os.O_NONBLOCK)
+    except OSError as e:
+        shutil.rmtree(fifo_dir, ignore_errors=True)
+        logger.debug(f"Pane output stream unavailable, falling back to polling: {e}")
+        return
     
-    for _, amount in transfers:
+    PANE_OUTPUT_STREAMS[session_name] = (read_fd, write_fd, fifo_dir)
+    subprocess.run(["tmux", "pipe-pane", "-o", "-t", session_name, f"cat >> {shlex.quote(fifo_path)}"], check=True)
+
+def wait_for_pane_output(session_name, timeout):
+    """
+    Blocks until the pane prints new output or the timeout expires, then drains the FIFO.
+    The FIFO is only a wake-up signal: the pane content itself is still read with capture-pane.
+    Without a stream for the session, simply sleeps for the timeout.
+    Returns True if new output arrived.
+    """
+    stream = PANE_OUTPUT_STREAMS.get(session_name)
+    if stream is None:
+        time.sleep(timeout)
+        return False
+    
+    read_fd = stream[0]
+    readable, _, _ = select.select([read_fd], [], [], timeout)
+    if readable:
         try:
-            amount_float = float(amount)
-            total += amount_float
-        except ValueError:
-            logger.warning(f"Unable to convert amount '{amount}' to number")
+            while os.read(read_fd, 65536):
+                pass
+        except BlockingIOError:
+            pass
+    return bool(readable)
+
+def wait_for_pane_idle(session_name, max_wait, quiet_time=PANE_IDLE_TIME):
+    """
+    Waits until the pane has printed nothing for quiet_time seconds, at most max_wait seconds.
+    Without a stream for the session, simply sleeps for max_wait.
+    """
+    if session_name not in PANE_OUTPUT_STREAMS:
+        time.sleep(max_wait)
+        return
     
-    total_with_fees = total + (len(transfers) * fees_estimate)
-    return total, total_with_fees
+    deadline = time.time() + max_wait
+    while True:
+        remaining = deadline - time.time()
+        if remaining <= 0 or not wait_for_pane_output(session_name, min(quiet_time, remaining)):
+            return
 
-def tmux_send_command_with_pattern(session_name, command, expected_pattern=None, max_wait=30, password=False, success_message=None):
-    """Sends a command and waits for a specific pattern in the output"""
-    # Define default patterns based on the command
+def cleanup_session(session_name):
+    """Closes the tmux session along with its control-mode client and pane output stream"""
+    logger.info("Closing tmux session...")
+    discard_tmux_control_client(session_name)
+    subprocess.run(["tmux", "kill-session", "-t", session_name], check=True)
+    stream = PANE_OUTPUT_STREAMS.pop(session_name, None)
+    if stream is not None:
+        read_fd, write_fd, fifo_dir = stream
+        os.close(read_fd)
+        os.close(write_fd)
+        shutil.rmtree(fifo_dir, ignore_errors=True)
+    logger.info("✅ Tmux session closed successfully")
+
+def pane_tail_contains(output, needle):
+    """Checks whether the pane output contains a marker, scanning from the end of the pane"""
+    # Prompts and fresh output are printed at the bottom of the pane, so a backward
+    # search stops after a few hundred bytes instead of walking the whole capture
+    return output.rfind(needle) != -1
+
+# Default pattern awaited after each CLI command, keyed by command name
+DEFAULT_EXPECTED_PATTERNS = {
+    "network": "Setting network id to:",
+    "connect": "Connected to Kaspa node",
+    "open": "Enter wallet password:",
+    "send": "Enter wallet password:",
+    "exit": "bye!",
+}
+DEFAULT_PROMPT_PATTERN = "$"  # Default, wait for the prompt
+
+def tmux_send_text(session_name, text, password=False):
+    """
+    Types a command (or password) into the pane followed by Enter.
+    Goes through the persistent control-mode client when possible, otherwise through a tmux client process.
+    """
+    if "\n" not in text:
+        try:
+            if not text:
+                # Nothing to type (e.g. empty password): only confirm with Enter
+                tmux_control_commands(session_name, "send-keys Enter")
+            elif password:
+                # The password is set in a tmux buffer, pasted (then deleted) and confirmed with Enter:
+                # it travels through the control client's pipe and never appears in a process argv
+                tmux_control_commands(
+                    session_name,
+                    f"set-buffer -b {TMUX_PASSWORD_BUFFER} -- {tmux_quote(text)}",
+                    f"paste-buffer -d -b {TMUX_PASSWORD_BUFFER}",
+                    "send-keys Enter"
+                )
+            else:
+                # With -l, tmux does not translate key names such as "Enter" or "C-c" found in the text
+                tmux_control_commands(session_name, f"send-keys -l -- {tmux_quote(text)}", "send-keys Enter")
+            return
+        except (OSError, EOFError):
+            # Client de contrôle indisponible: envoi par un client tmux classique
+            discard_tmux_control_client(session_name)
+    
+    # close_fds=False on the frequent tmux calls: descriptors opened by Python are non-inheritable
+    # (PEP 446), so the descriptor close loop before exec can be skipped
+    send_keys_argv = tmux_send_keys_argv(session_name)
+    if not text:
+        subprocess.run(send_keys_argv + ("Enter",), check=True, close_fds=False)
+    elif password:
+        # The password is loaded into a tmux buffer from stdin, pasted (then deleted) and confirmed with Enter,
+        # all in a single tmux call: it never appears in a process argv and needs no escaping
+        subprocess.run(
+            ("tmux", "load-buffer", "-b", TMUX_PASSWORD_BUFFER, "-", ";",
+             "paste-buffer", "-d", "-b", TMUX_PASSWORD_BUFFER, "-t", session_name, ";")
+            + send_keys_argv[1:] + ("Enter",),
+            input=text.encode('utf-8'),
+            check=True,
+            close_fds=False
+        )
+    else:
+        # Send the command as literal text followed by Enter in a single tmux call
+        # With -l, tmux does not translate key names such as "Enter" or "C-c" found in the text
+        subprocess.run(
+            send_keys_argv + ("-l", "--", tmux_literal_argument(text), ";") + send_keys_argv[1:] + ("Enter",),
+            check=True,
+            close_fds=False
+        )
+
+def tmux_send_command_with_pattern(session_name, command, expected_pattern=None, max_wait=30, password=False, success_message=None, since=None):
+    """
+    Sends a command and waits for a specific pattern in the output.
+    Only the output from the line where the command is typed is scanned, or from the line since (see pane_mark)
+    for a step of a command typed earlier, so prompts left on the pane by previous commands never match.
+    """
+    # Define default patterns based on the command name (never derived from a password)
     if expected_pattern is None:
-        if "network" in command:
-            expected_pattern = "Setting network id to:"
-        elif "connect" in command:
-            expected_pattern = "Connected to Kaspa node"
-        elif command == "open":
-            expected_pattern = "Enter wallet password:"
-        elif "send" in command:
-            expected_pattern = "Enter wallet password:"
-        elif command == "exit":
-            expected_pattern = "bye!"
-        else:
-            expected_pattern = "$"  # Default, wait for the prompt
+        command_name = "" if password else command.split(" ", 1)[0]
+        expected_pattern = DEFAULT_EXPECTED_PATTERNS.get(command_name, DEFAULT_PROMPT_PATTERN)
     
     # Don't display passwords in logs
     display_cmd = command if not password else "[PASSWORD]"
     logger.info(f"Executing command: {display_cmd}")
     
-    # Send the command
-    # Handle passwords specially to avoid issues with special characters
-    if password:
-        # For passwords, we send each character individually to avoid shell interpretation issues
-        for char in command:
-            char_cmd = f'tmux send-keys -t {session_name} "{char}"'
-            subprocess.run(char_cmd, shell=True, check=True)
-        # Then send Enter key
-        subprocess.run(f'tmux send-keys -t {session_name} Enter', shell=True, check=True)
-    else:
-        # For regular commands, escape double quotes
-        escaped_command = command.replace('"', '\\"')
-        cmd = f'tmux send-keys -t {session_name} "{escaped_command}" Enter'
-        subprocess.run(cmd, shell=True, check=True)
+    if since is None:
+        since = pane_mark(session_name)
+    tmux_send_text(session_name, command, password)
     
     # Wait for the expected pattern
+    # The pane is scanned as raw bytes and only decoded once the wait is over
+    expected_bytes = expected_pattern.encode('utf-8')
     start_time = time.time()
     found = False
-    
+    output = b""
+    previous_output = None
+    poll_interval = PANE_POLL_MIN_INTERVAL
+
     while time.time() - start_time < max_wait and not found:
         # Capture current output
-        output_cmd = f'tmux capture-pane -p -t {session_name}'
-        output = subprocess.run(output_cmd, shell=True, check=True, stdout=subprocess.PIPE).stdout.decode('utf-8')
+        output = capture_pane_bytes(session_name, since=since)
         
+        # Unchanged pane (compared by length first, then bytes): nothing new to scan
+        if output == previous_output:
+            pass
         # Check if pattern is present
-        if expected_pattern in output:
+        elif pane_tail_contains(output, expected_bytes):
             found = True
-            # If we found a pattern for a password, wait a small additional delay
+            # If we found a pattern for a password, let the CLI settle on the prompt before typing:
+            # a fixed pause, the CLI may print nothing more while it switches to reading the password
             if expected_pattern == "Enter wallet password:" or expected_pattern == "Enter payment password:":
-                time.sleep(0.5)
+                time.sleep(PASSWORD_PROMPT_SETTLE)
         else:
             # Check if we have a new pattern indicating the next state
-            if "Enter payment password:" in output and expected_pattern == "Enter wallet password:":
+            if expected_pattern == "Enter wallet password:" and pane_tail_contains(output, b"Enter payment password:"):
                 found = True
-            elif "Send - Amount:" in output:
+            elif pane_tail_contains(output, b"Send - Amount:"):
                 found = True
             
             # Also check for error conditions
-            if "Unable to decrypt" in output:
+            if pane_tail_contains(output, b"Unable to decrypt"):
                 logger.error("❌ Authentication error: Unable to decrypt")
                 found = True  # Consider it found to avoid timeout, we'll handle the error elsewhere
         
+        previous_output = output
         if not found:
-            time.sleep(0.5)
+            if session_name in PANE_OUTPUT_STREAMS:
+                # Wait for the CLI to print something new (bounded, in case the pipe misses an update)
+                remaining = max_wait - (time.time() - start_time)
+                wait_for_pane_output(session_name, max(0, min(remaining, PANE_OUTPUT_WAIT_MAX)))
+            else:
+                # Adaptive backoff: fast commands are detected quickly, slow ones are not polled needlessly
+                time.sleep(poll_interval)
+                poll_interval = min(poll_interval * 1.5, PANE_POLL_MAX_INTERVAL)
     
     # If we didn't find the pattern within the timeout
     if not found:
@@ -373,102 +919,144 @@ def tmux_send_command_with_pattern(session_name, command, expected_pattern=None,
         if success_message:
             logger.info(f"{success_message}")
     
-    # Capture final state for debugging (always log to debug level)
-    output_cmd = f'tmux capture-pane -p -t {session_name}'
-    output = subprocess.run(output_cmd, shell=True, check=True, stdout=subprocess.PIPE).stdout.decode('utf-8')
-    logger.debug(f"State after command '{display_cmd}':\n{output}")
+    # Log final state for debugging (always log to debug level)
+    # The last capture of the wait loop is reused instead of spawning another tmux client,
+    # and it is only decoded when it is returned or actually logged
+    if not found and not logger.isEnabledFor(logging.DEBUG):
+        return None
+    output = output.decode('utf-8')
+    logger.debug("State after command '%s':\n%s", display_cmd, output)
     
     return output if found else None
 
+def parse_balance(output, patterns):
+    """Returns the balance matched by the first pattern that converts to a number, or None"""
+    for pattern in patterns:
+        match = pattern.search(output)
+        if match:
+            try:
+                balance_str = match.group(1).replace(',', '')
+                logger.debug(f"Match found using pattern: {pattern.pattern}")
+                logger.debug(f"Extracted balance string: {balance_str}")
+                return float(balance_str)
+            except Exception as e:
+                logger.debug(f"Regex match found but conversion error: {e}")
+    return None
+
+def wait_for_balance(session_name, patterns, since, max_wait=BALANCE_OUTPUT_WAIT_MAX):
+    """
+    Captures the pane until a balance is displayed or max_wait expires, waking up as soon as the CLI prints.
+    Only the output from the line since (see pane_mark) is parsed, so a balance printed earlier is never read.
+    Returns (balance or None, last captured output).
+    """
+    deadline = time.time() + max_wait
+    while True:
+        output = capture_pane(session_name, joined=True, since=since)
+        balance = parse_balance(output, patterns)
+        remaining = deadline - time.time()
+        if balance is not None or remaining <= 0:
+            return balance, output
+        wait_for_pane_output(session_name, min(remaining, PANE_OUTPUT_WAIT_MAX))
+
 def get_wallet_balance(session_name, currency_symbol):
     """Retrieves the current wallet balance using the 'list' command"""
+    # Patterns précompilés pour la devise du réseau
+    patterns = BALANCE_PATTERNS[currency_symbol]
+    
     # Exécuter la commande 'list' pour afficher les comptes et leurs soldes
     logger.info("Requesting wallet balance information...")
+    list_mark = pane_mark(session_name)
     tmux_send_command_with_pattern(
         session_name,
         "list",
         "$",
-        10
+        10,
+        since=list_mark
     )
     
-    # Attendre que le solde s'affiche
-    time.sleep(2)
-    
-    # Capturer la sortie
-    output_cmd = f'tmux capture-pane -p -t {session_name}'
-    output = subprocess.run(output_cmd, shell=True, check=True, stdout=subprocess.PIPE).stdout.decode('utf-8')
+    # Attendre que le solde s'affiche, dans la sortie de cette commande seulement
+    balance, output = wait_for_balance(session_name, patterns, list_mark)
     
     # Log complet pour débogage
-    logger.debug(f"Output for balance extraction:\n{output}")
-    
-    # Plusieurs patterns pour attraper différents formats d'affichage du solde
-    # Note: [\d,]+ capture les chiffres avec ou sans virgules comme séparateurs de milliers
-    patterns = [
-        # Format de la commande list: "w0111 [30d92145]: 6,007 KAS"
-        r':\s*([\d,]+(?:\.\d+)?)\s*' + re.escape(currency_symbol),
-        # Format standard: "• 123.456 KAS" ou "• 6,007 KAS"
-        r'•\s*([\d,]+(?:\.\d+)?)\s*' + re.escape(currency_symbol),
-        # Format balance: "Balance: 123.456 KAS"
-        r'[Bb]alance[:]?\s*([\d,]+(?:\.\d+)?)\s*' + re.escape(currency_symbol),
-        # Format avec parenthèses: "(123.456 KAS)" ou "(6,007 KAS)"
-        r'\(\s*([\d,]+(?:\.\d+)?)\s*' + re.escape(currency_symbol) + r'\)',
-        # Format générique: tout nombre suivi du symbole de devise
-        r'([\d,]+(?:\.\d+)?)\s*' + re.escape(currency_symbol)
-    ]
-    
-    # Essayer chaque pattern
-    for pattern in patterns:
-        match = re.search(pattern, output)
-        if match:
-            try:
-                balance_str = match.group(1).replace(',', '')
-                logger.debug(f"Match found using pattern: {pattern}")
-                logger.debug(f"Extracted balance string: {balance_str}")
-                return float(balance_str)
-            except Exception as e:
-                logger.debug(f"Regex match found but conversion error: {e}")
+    logger.debug("Output for balance extraction:\n%s", output)
+    if balance is not None:
+        return balance
     
     # Si aucun pattern ne fonctionne, essayer avec la commande 'details'
     logger.info("Balance not found with 'list', trying 'details' command...")
+    details_mark = pane_mark(session_name)
     tmux_send_command_with_pattern(
         session_name,
         "details",
         "$",
-        10
+        10,
+        since=details_mark
     )
     
-    # Attendre que les infos s'affichent
-    time.sleep(2)
-    
-    # Recapturer la sortie
-    output = subprocess.run(output_cmd, shell=True, check=True, stdout=subprocess.PIPE).stdout.decode('utf-8')
-    logger.debug(f"Output from 'details' command:\n{output}")
-    
-    # Réessayer tous les patterns
-    for pattern in patterns:
-        match = re.search(pattern, output)
-        if match:
-            try:
-                balance_str = match.group(1).replace(',', '')
-                return float(balance_str)
-            except Exception as e:
-                logger.debug(f"Regex match found but conversion error: {e}")
+    # Attendre que les infos s'affichent et réessayer tous les patterns
+    balance, output = wait_for_balance(session_name, patterns, details_mark)
+    logger.debug("Output from 'details' command:\n%s", output)
+    if balance is not None:
+        return balance
     
     logger.warning("Unable to extract wallet balance")
     return None
 
-def extract_transaction_id(output):
-    """Extracts the transaction ID from the CLI output"""
-    try:
-        tx_lines = [line for line in output.split('\n') if "tx ids:" in line]
-        if tx_lines:
-            tx_line = tx_lines[-1]  # Take the last line with tx ids
-            if ":" in tx_line:
-                tx_id = tx_line.split(":")[-1].strip()
-                return tx_id
-    except Exception as e:
-        logger.debug(f"Error extracting transaction ID: {e}")
-    return None
+def command_output(output, command):
+    """Returns the pane output printed after the last echo of command, or None if the echo is not visible"""
+    command_pos = output.rfind(command)
+    if command_pos == -1:
+        return None
+    return output[command_pos + len(command):]
+
+def wait_for_payment_step(session_name, since, max_wait=PAYMENT_STEP_WAIT_MAX):
+    """
+    After the wallet password of a send, waits until the CLI either asks for the payment password or starts sending.
+    Returns the output printed since the send (line since, from pane_mark), or None if neither appeared within max_wait seconds.
+    """
+    deadline = time.time() + max_wait
+    while True:
+        wait_for_pane_idle(session_name, PASSWORD_PROMPT_SETTLE_MAX)
+        current_output = capture_pane(session_name, joined=True, since=since)
+        if "Enter payment password:" in current_output or "Send - Amount:" in current_output:
+            return current_output
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            return None
+        wait_for_pane_output(session_name, min(remaining, PANE_OUTPUT_WAIT_MAX))
+
+def wait_for_send_result(session_name, since, max_wait=SEND_RESULT_WAIT_MAX):
+    """
+    Waits until the output printed since the send (line since, from pane_mark) shows its outcome:
+    the transaction IDs or an error. Returns that output, or the last capture if no outcome appeared within max_wait seconds.
+    """
+    deadline = time.time() + max_wait
+    while True:
+        output = capture_pane(session_name, joined=True, since=since)
+        if any(match.lastgroup != "sending" for match in TRANSFER_OUTCOME_PATTERN.finditer(output)):
+            return output
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            return output
+        wait_for_pane_output(session_name, min(remaining, PANE_OUTPUT_WAIT_MAX))
+
+def extract_transaction_id(output, command=None):
+    """
+    Extracts the transaction ID from the CLI output, only after the last echo of command if given
+    (the pane still shows the IDs of the previous transfers): None if that echo is not found, so the output
+    should come from a joined capture where the long send command is not wrapped.
+    The IDs are printed one per line after "tx ids:"; the last one is the transaction paying the recipient.
+    """
+    if command is not None:
+        output = command_output(output, command)
+        if output is None:
+            return None
+    # Search backwards for the last "tx ids:" marker instead of splitting the whole output
+    marker_pos = output.rfind("tx ids:")
+    if marker_pos == -1:
+        return None
+    tx_ids = TRANSACTION_ID_PATTERN.findall(output, marker_pos)
+    return tx_ids[-1] if tx_ids else None
 
 def get_available_wallets(session_name):
     """Gets a list of available wallets using the wallet list command"""
@@ -484,8 +1072,7 @@ def get_available_wallets(session_name):
     )
     
     # Execute the wallet list command with increased wait time
-    print("⏳ Fetching wallet list...")
-    logger.info("Executing 'wallet list' command...")
+    ui("⏳ Fetching wallet list...")
     tmux_send_command_with_pattern(
         session_name, 
         "wallet list", 
@@ -494,18 +1081,17 @@ def get_available_wallets(session_name):
         success_message="✅ Wallet list command executed"
     )
     
-    # Wait extra time for the output to fully populate
-    time.sleep(3)
+    # Wait for the output to fully populate: until the CLI stops printing, at most WALLET_LIST_WAIT_MAX seconds
+    wait_for_pane_idle(session_name, WALLET_LIST_WAIT_MAX, CLI_OUTPUT_QUIET_TIME)
     
     # Capture the full output
-    output_cmd = f'tmux capture-pane -p -t {session_name}'
-    output = subprocess.run(output_cmd, shell=True, check=True, stdout=subprocess.PIPE).stdout.decode('utf-8')
+    output = capture_pane(session_name)
     
     # Log the complete output for debugging (to log file only, not terminal)
-    logger.debug(f"Output from 'wallet list' command:\n{output}")
+    logger.debug("Output from 'wallet list' command:\n%s", output)
     
-    # Parse output to find wallet names
-    wallets = []
+    # Parse output to find wallet names (dict keys: insertion order kept, duplicates checked by hash lookup)
+    wallets = {}
     
     # First look for the specific pattern shown in the example ("Wallets:" section)
     wallets_section_idx = output.find("Wallets:")
@@ -518,7 +1104,7 @@ def get_available_wallets(session_name):
             wallets_section = wallets_section.split("$")[0]  # Stop at the next prompt
         
         # Process each line
-        for line in wallets_section.split('\n')[1:]:  # Skip the "Wallets:" line
+        for line in wallets_section.splitlines()[1:]:  # Skip the "Wallets:" line
             line = line.strip()
             if not line:
                 continue
@@ -532,36 +1118,40 @@ def get_available_wallets(session_name):
                 logger.debug(f"Found wallet: '{wallet_name}'")
                 
             if wallet_name and wallet_name not in wallets:
-                wallets.append(wallet_name)
+                wallets[wallet_name] = None
+    wallets = list(wallets)
     
     # If no wallets found, add default kaspa wallet
     if not wallets:
-        print("No wallets detected. Using default wallet 'kaspa'")
-        logger.warning("No wallets detected. Using default wallet 'kaspa'")
+        ui("No wallets detected. Using default wallet 'kaspa'", logging.WARNING)
         wallets = ["kaspa"]
     
-    print(f"\nDetected wallets: {', '.join(wallets)}")
-    logger.info(f"Detected wallets: {', '.join(wallets)}")
+    ui(f"\nDetected wallets: {', '.join(wallets)}")
     return wallets
 
 def attempt_transfer(session_name, address, amount, wallet_password, payment_password, currency_symbol, max_attempts=TRANSFER_RETRY_ATTEMPTS):
-    """Tente d'effectuer un transfert avec plusieurs essais en cas d'erreur 'Insufficient funds'"""
+    """
+    Tente d'effectuer un transfert avec plusieurs essais en cas d'erreur 'Insufficient funds'.
+    Retourne (sortie, None, None) en cas de succès, sinon (None, message d'erreur, type d'erreur).
+    """
     
     for attempt in range(1, max_attempts + 1):
         if attempt > 1:
-            print(f"🔄 Tentative #{attempt} pour transférer {amount} {currency_symbol} vers {address}...")
-            logger.info(f"Tentative #{attempt} pour transférer {amount} {currency_symbol} vers {address}")
+            ui(f"🔄 Tentative #{attempt} pour transférer {amount} {currency_symbol} vers {address}...")
             
-        # Envoi de la commande
+        # Envoi de la commande: le terminal affiche encore les transferts précédents, les invites
+        # et le résultat ne sont cherchés qu'à partir de la ligne où cette commande est tapée
+        send_mark = pane_mark(session_name)
         send_output = tmux_send_command_with_pattern(
             session_name, 
             f"send {address} {amount}", 
             "Enter wallet password:",
-            success_message=f"✅ Commande de transfert acceptée pour {address}" if attempt == 1 else None
+            success_message=f"✅ Commande de transfert acceptée pour {address}" if attempt == 1 else None,
+            since=send_mark
         )
         
         if send_output is None:
-            return None, "Erreur d'envoi de commande"
+            return None, "Erreur d'envoi de commande", "Erreur d'envoi de commande"
         
         # Mot de passe du portefeuille
         wallet_password_output = tmux_send_command_with_pattern(
@@ -569,172 +1159,263 @@ def attempt_transfer(session_name, address, amount, wallet_password, payment_pas
             wallet_password, 
             "Enter payment password:", 
             password=True,
-            success_message="✅ Mot de passe portefeuille accepté" if attempt == 1 else None
+            success_message="✅ Mot de passe portefeuille accepté" if attempt == 1 else None,
+            since=send_mark
         )
         
         if wallet_password_output is None:
-            return None, "Erreur de mot de passe portefeuille"
+            return None, "Erreur de mot de passe portefeuille", "Erreur de mot de passe portefeuille"
         
-        # Mot de passe de paiement
-        payment_output = tmux_send_command_with_pattern(
-            session_name, 
-            payment_password, 
-            "Send - Amount:", 
-            password=True,
-            success_message="✅ Mot de passe de paiement accepté" if attempt == 1 else None
-        )
+        # Mot de passe de paiement, seulement si le CLI le demande: sans secret de paiement sur le compte,
+        # l'envoi démarre directement et le mot de passe serait tapé sur la ligne de commande du CLI.
+        # Le terminal affiche encore les transferts précédents: décider seulement d'après la sortie de cet envoi,
+        # et ne sauter l'étape que si l'envoi a démarré.
+        current_output = wait_for_payment_step(session_name, send_mark)
+        if (current_output is not None and "Send - Amount:" in current_output
+                and "Enter payment password:" not in current_output):
+            logger.debug("No payment password requested by the CLI")
+        else:
+            tmux_send_command_with_pattern(
+                session_name, 
+                payment_password, 
+                "Send - Amount:", 
+                password=True,
+                success_message="✅ Mot de passe de paiement accepté" if attempt == 1 else None,
+                since=send_mark
+            )
+        
+        # Vérifier le résultat, seulement dans la sortie de cet envoi: attendre que le CLI affiche
+        # les IDs de transaction ou une erreur (le début de l'envoi seul ne suffit pas)
+        output = wait_for_send_result(session_name, send_mark)
         
-        # Vérifier le résultat
-        output_cmd = f'tmux capture-pane -p -t {session_name}'
-        output = subprocess.run(output_cmd, shell=True, check=True, stdout=subprocess.PIPE).stdout.decode('utf-8')
+        # Une seule passe sur la sortie: position de la première occurrence de chaque marqueur
+        markers = {}
+        for match in TRANSFER_OUTCOME_PATTERN.finditer(output):
+            markers.setdefault(match.lastgroup, match.start())
         
         # Si transfert réussi
-        if "Sending" in output and "tx ids:" in output:
-            tx_id = extract_transaction_id(output)
-            return output, None  # Succès
+        if "sending" in markers and "tx_ids" in markers:
+            return output, None, None  # Succès
         
         # Si insufficient funds, on réessaie
-        elif "Insufficient funds" in output and attempt < max_attempts:
+        elif "insufficient_funds" in markers and attempt < max_attempts:
             logger.warning(f"⚠️ Fonds insuffisants pour cette transaction spécifique (tentative {attempt}/{max_attempts})")
-            print(f"⚠️ Message 'Insufficient funds' - attente de {TRANSFER_RETRY_DELAY}s avant nouvelle tentative...")
+            ui(f"⚠️ Message 'Insufficient funds' - attente de {TRANSFER_RETRY_DELAY}s avant nouvelle tentative...")
             time.sleep(TRANSFER_RETRY_DELAY)
             continue  # Passer à la prochaine tentative
         
         # Autres erreurs ou dernier essai échoué
         else:
-            if "Insufficient funds" in output:
+            if "insufficient_funds" in markers:
                 error_msg = "Fonds insuffisants après plusieurs tentatives"
-            elif "invalid address" in output:
+            elif "invalid_address" in markers:
                 error_msg = "Adresse invalide"
-            elif "network error" in output:
+            elif "network_error" in markers:
                 error_msg = "Erreur réseau"
-            elif "error" in output.lower():
-                try:
-                    error_lines = [line for line in output.split('\n') if "error" in line.lower()]
-                    if error_lines:
-                        error_msg = error_lines[0].strip()
-                    else:
-                        error_msg = "Erreur inconnue"
-                except:
-                    error_msg = "Erreur inconnue"
+            elif "error" in markers:
+                # Première ligne contenant "error": gardée pour le détail, mais comptée sous un type fixe
+                # (le texte du CLI varie d'un transfert à l'autre avec les montants et les UTXO)
+                error_pos = markers["error"]
+                line_start = output.rfind('\n', 0, error_pos) + 1
+                line_end = output.find('\n', error_pos)
+                error_msg = output[line_start:line_end if line_end != -1 else None].strip()
+                return None, error_msg, CLI_ERROR_KIND
             else:
                 error_msg = "Erreur inconnue"
             
-            return None, error_msg
+            return None, error_msg, error_msg
     
-    return None, "Échec après plusieurs tentatives"
+    return None, "Échec après plusieurs tentatives", "Échec après plusieurs tentatives"
 
-def automate_kaspa_transfers():
-    """Automates Kaspa transfers via CLI interface"""
-    # Ask user to choose network
-    while True:
-        network_choice = input("Choose network (mainnet/testnet): ").strip().lower()
-        if network_choice in ["mainnet", "testnet"]:
-            break
-        else:
-            print("Please enter 'mainnet' or 'testnet'.")
+def record_error(error_counts, error_details, kind, detail):
+    """Counts an error by kind, keeping its detail only while fewer than ERROR_DETAILS_MAX are kept"""
+    error_counts[kind] += 1
+    if len(error_details) < ERROR_DETAILS_MAX:
+        error_details.append(detail)
+
+def read_ledger(ledger_path):
+    """Returns {index: (address, amount)} for the transfers recorded as sent in a ledger file"""
+    sent = {}
+    with open(ledger_path, 'r') as ledger:
+        for line in ledger:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # Dernière ligne tronquée par un arrêt brutal
+            if entry.get("status") == "sent":
+                sent[entry["i"]] = (entry["addr"], entry["amt"])
+    return sent
+
+def send_transfers(session_name, transfers, wallet_password, payment_password, currency_symbol, ledger_path, skip=frozenset()):
+    """
+    Phase d'envoi: envoie tous les transferts à la suite, sans attendre leur vérification.
+    Chaque résultat est ajouté aussitôt au journal ledger_path (une ligne JSON par transfert), pour pouvoir
+    reprendre le lot après une interruption; les index de skip (déjà envoyés) sont ignorés.
+    Retourne (transferts envoyés, nombre d'échecs, erreurs par type, premières erreurs détaillées, heure du dernier envoi).
+    """
+    failed_transfers = 0
+    error_counts = Counter()  # Nombre d'erreurs par type
+    error_details = []  # Premières erreurs détaillées, voir record_error
+    sent_transfers = []  # Transferts envoyés à vérifier: (index, adresse, montant, montant en sompi, ID de transaction)
+    last_send_time = None
+    transfer_count = len(transfers)
+    to_send_count = transfer_count - len(skip)
     
-    # Load network configuration
-    network_config = NETWORK_CONFIGS[network_choice]
-    logger.info(f"Selected network: {network_choice}")
+    # Sur un terminal, une barre de progression remplace le détail de chaque transfert (gardé dans le fichier de log)
+    show_progress = sys.stdout.isatty()
+    last_draw = 0.0
     
-    # Check if redistribution file exists
-    if not os.path.exists(REDISTRIBUTION_FILE):
-        logger.error(f"The file {REDISTRIBUTION_FILE} does not exist!")
-        return
+    # Les envois restent séquentiels dans une seule session CLI, pour ne pas dépenser deux fois les mêmes UTXO.
+    # Toutes les réceptions sont ensuite vérifiées ensemble, une requête par adresse et par cycle.
+    with open(ledger_path, 'a', buffering=1) as ledger, console_quieted() if show_progress else contextlib.nullcontext():
+        for i, (address, amount, amount_sompi) in enumerate(transfers):
+            if i in skip:
+                continue
+            
+            # Use only one output method for transfer start message
+            logger.info(f"[{i+1}/{transfer_count}] Sending {amount} {currency_symbol} to {address}")
+            
+            # Utiliser le mécanisme de retry pour les transferts
+            output, error, error_kind = attempt_transfer(
+                session_name, 
+                address, 
+                amount, 
+                wallet_password, 
+                payment_password,
+                currency_symbol
+            )
+            
+            if output is not None:  # Transfert réussi
+                # Try to extract transaction ID
+                command = f"send {address} {amount}"
+                tx_id = extract_transaction_id(output, command)
+                if tx_id is None:
+                    # Les IDs s'affichent sous le marqueur "tx ids:": laisser le CLI finir d'écrire et relire le terminal
+                    wait_for_pane_idle(session_name, INTER_SEND_DELAY)
+                    tx_id = extract_transaction_id(capture_pane(session_name, joined=True), command)
+            
+                # La réception sera vérifiée avec le reste du lot, sans bloquer le transfert suivant
+                sent_transfers.append((i, address, amount, amount_sompi, tx_id))
+                last_send_time = time.time()
+                ledger.write(json.dumps({"i": i, "addr": address, "amt": amount, "status": "sent", "tx": tx_id}) + "\n")
+            else:  # Transfert échoué
+                ui(f"❌ Échec du transfert: {amount} {currency_symbol} → {address} - {error}", logging.ERROR)
+                record_error(error_counts, error_details, error_kind, f"Transfer #{i+1}: {error}")
+                failed_transfers += 1
+                ledger.write(json.dumps({"i": i, "addr": address, "amt": amount, "status": "failed", "err": error}) + "\n")
+            
+                # Si l'erreur indique un manque de fonds global et non local à la transaction
+                if error and GLOBAL_FUNDS_ERROR_PATTERN.search(error) and "Insufficient funds" not in error:
+                    ui(f"❌ Arrêt des transferts - fonds globalement insuffisants", logging.ERROR)
+                    break
+            
+            if show_progress:
+                last_draw = draw_progress(len(sent_transfers) + failed_transfers, to_send_count, failed_transfers, last_draw)
+            
+            # Between transfers, let the CLI finish printing the result and its prompt (bounded by INTER_SEND_DELAY)
+            if i + 1 < transfer_count:
+                wait_for_pane_idle(session_name, INTER_SEND_DELAY)
     
-    # Read redistribution file
-    transfers = read_redistribution_file(REDISTRIBUTION_FILE, network_config["address_prefix"])
-    if not transfers:
-        logger.warning(f"No transfers to make for network {network_choice}. Check the redistribution file.")
-        return
+    if show_progress:
+        draw_progress(len(sent_transfers) + failed_transfers, to_send_count, failed_transfers, final=True)
     
-    # Calculate total amount to transfer
-    total_amount, total_with_fees = calculate_total_amount(transfers)
-    logger.info(f"Found {len(transfers)} transfers to make for a total of {total_amount} {network_config['currency_symbol']}")
-    logger.info(f"Estimated total with fees: {total_with_fees} {network_config['currency_symbol']}")
+    return sent_transfers, failed_transfers, error_counts, error_details, last_send_time
+
+def parse_arguments():
+    """Parses the command-line options; any choice left unset is asked interactively"""
+    parser = argparse.ArgumentParser(description="Batch Kaspa transfers through the Kaspa CLI wallet")
+    parser.add_argument("--network", choices=sorted(NETWORK_CONFIGS), help="network to use, instead of asking")
+    parser.add_argument("--wallet", metavar="NAME", help="wallet to open, instead of listing the wallets and asking")
+    parser.add_argument("-y", "--yes", action="store_true",
+                        help="proceed with the transfers without asking for confirmation, unless the balance is insufficient")
+    parser.add_argument("--allow-insufficient-balance", action="store_true",
+                        help="with --yes, proceed even if the balance does not cover all the transfers")
+    parser.add_argument("--wallet-password-env", metavar="VAR", default=WALLET_PASSWORD_ENV,
+                        help=f"environment variable holding the wallet password (default: {WALLET_PASSWORD_ENV})")
+    parser.add_argument("--payment-password-env", metavar="VAR", default=PAYMENT_PASSWORD_ENV,
+                        help=f"environment variable holding the payment password (default: {PAYMENT_PASSWORD_ENV}, "
+                             "the wallet password if unset)")
+    parser.add_argument("--resume", metavar="LEDGER",
+                        help="ledger file of an interrupted run: skip the transfers it records as sent and keep appending to it")
+    return parser.parse_args()
+
+def read_password(env_var, prompt):
+    """Reads a password from the given environment variable if it is set, otherwise asks for it (no terminal switch otherwise)"""
+    password = os.environ.get(env_var)
+    if password is not None:
+        logger.info(f"Using password from environment variable {env_var}")
+        return password
+    return getpass.getpass(prompt)
+
+def connect_node(session_name, network_choice, network_config):
+    """Starts the Kaspa CLI in the tmux session, selects the network and connects to a node; returns True on success"""
+    # Initialize Kaspa CLI
+    logger.info("Starting Kaspa CLI...")
+    cli_result = tmux_send_command_with_pattern(
+        session_name,
+        f"cd ~/rusty-kaspa/cli && cargo run --release",
+        "type 'help' for list of commands",
+        30,
+        success_message="✅ Kaspa CLI started successfully"
+    )
+    if cli_result is None:
+        logger.error("❌ Failed to start Kaspa CLI")
+        return False
     
-    try:
-        # Check if tmux is installed
-        try:
-            subprocess.run(["tmux", "-V"], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        except:
-            logger.error("tmux is not installed. Please install it with: sudo apt-get install tmux")
-            return
-        
-        # tmux session name
-        session_name = f"kaspa_auto_{int(time.time())}"
-        
-        # Create a new detached tmux session
-        logger.info("Creating a tmux session for Kaspa CLI...")
-        subprocess.run(f'tmux new-session -d -s {session_name}', shell=True, check=True)
-        logger.info("✅ Tmux session created successfully")
-        
-        # Initialize Kaspa CLI
-        logger.info("Starting Kaspa CLI...")
-        cli_result = tmux_send_command_with_pattern(
-            session_name, 
-            f"cd ~/rusty-kaspa/cli && cargo run --release", 
-            "type 'help' for list of commands", 
-            30,
-            success_message="✅ Kaspa CLI started successfully"
-        )
-        if cli_result is None:
-            logger.error("❌ Failed to start Kaspa CLI")
-            logger.info("Closing tmux session...")
-            subprocess.run(f'tmux kill-session -t {session_name}', shell=True, check=True)
-            return
+    # Connect to network
+    logger.info(f"Setting network to {network_choice}...")
+    network_result = tmux_send_command_with_pattern(
+        session_name,
+        network_config["network_cmd"],
+        "Setting network id to:",
+        max_wait=10,
+        success_message=f"✅ Network set to {network_choice}"
+    )
+    if network_result is None:
+        logger.error("❌ Failed to set network")
+        return False
+    
+    # Connect to Kaspa node with retry logic
+    logger.info("Connecting to Kaspa node...")
+    max_retries = CONNECT_RETRY_ATTEMPTS
+    retry_count = 0
+    connection_successful = False
+    
+    while retry_count < max_retries and not connection_successful:
+        if retry_count > 0:
+            logger.warning(f"Retrying connection to Kaspa node (attempt {retry_count+1}/{max_retries})...")
         
-        # Connect to network
-        logger.info(f"Setting network to {network_choice}...")
-        network_result = tmux_send_command_with_pattern(
-            session_name, 
-            network_config["network_cmd"], 
-            "Setting network id to:", 
+        connect_result = tmux_send_command_with_pattern(
+            session_name,
+            network_config["connect_cmd"],
+            "Connected to Kaspa node",
             max_wait=10,
-            success_message=f"✅ Network set to {network_choice}"
+            success_message="✅ Successfully connected to Kaspa node"
         )
-        if network_result is None:
-            logger.error("❌ Failed to set network")
-            logger.info("Closing tmux session...")
-            subprocess.run(f'tmux kill-session -t {session_name}', shell=True, check=True)
-            return
-        
-        # Connect to Kaspa node with retry logic
-        logger.info("Connecting to Kaspa node...")
-        max_retries = 3
-        retry_count = 0
-        connection_successful = False
-        
-        while retry_count < max_retries and not connection_successful:
-            if retry_count > 0:
-                logger.warning(f"Retrying connection to Kaspa node (attempt {retry_count+1}/{max_retries})...")
-                
-            connect_result = tmux_send_command_with_pattern(
-                session_name, 
-                network_config["connect_cmd"], 
-                "Connected to Kaspa node", 
-                max_wait=10,
-                success_message="✅ Successfully connected to Kaspa node"
-            )
-            
-            if connect_result is not None:
-                connection_successful = True
-            else:
-                retry_count += 1
-                if retry_count < max_retries:
-                    time.sleep(2)  # Wait before retry
-        
-        if not connection_successful:
-            logger.error("❌ Failed to connect to Kaspa node after 3 attempts")
-            logger.info("Closing tmux session...")
-            subprocess.run(f'tmux kill-session -t {session_name}', shell=True, check=True)
-            return
         
+        if connect_result is not None:
+            connection_successful = True
+        else:
+            retry_count += 1
+            if retry_count < max_retries:
+                # Backoff exponentiel plafonné: les premières tentatives sont rapides, les suivantes espacées
+                delay = min(CONNECT_RETRY_MAX_DELAY, CONNECT_RETRY_BASE_DELAY * 2 ** (retry_count - 1))
+                time.sleep(delay + random.uniform(0, CONNECT_RETRY_JITTER))
+    
+    if not connection_successful:
+        logger.error(f"❌ Failed to connect to Kaspa node after {max_retries} attempts")
+        return False
+    
+    print("\n✅ Connected to Kaspa node")
+    return True
+
+def select_wallet(session_name, wallet=None):
+    """Returns the wallet to use: the given one, the only one detected, or the one chosen from the detected list"""
+    # Select wallet (given as an option: no wallet list and no interactive choice)
+    selected_wallet = wallet
+    if selected_wallet is None:
         # Get available wallets - this will now display raw output for debugging
-        print("\n✅ Connected to Kaspa node")
         print("\n📋 Getting available wallets...")
-        
         available_wallets = get_available_wallets(session_name)
         
         # Print available wallets to console
@@ -742,12 +1423,9 @@ def automate_kaspa_transfers():
         for i, wallet in enumerate(available_wallets):
             print(f"  {i+1}. {wallet}")
         
-        # Select wallet
-        selected_wallet = None
         if len(available_wallets) == 1:
             selected_wallet = available_wallets[0]
-            print(f"\nOnly one wallet available. Automatically selecting: {selected_wallet}")
-            logger.info(f"Only one wallet available. Automatically selecting: {selected_wallet}")
+            ui(f"\nOnly one wallet available. Automatically selecting: {selected_wallet}")
         else:
             while True:
                 wallet_choice = input(f"\nChoose wallet (1-{len(available_wallets)}): ").strip()
@@ -760,242 +1438,314 @@ def automate_kaspa_transfers():
                         print(f"Please enter a number between 1 and {len(available_wallets)}.")
                 except ValueError:
                     print("Please enter a valid number.")
+    
+    ui(f"\n✅ Selected wallet: {selected_wallet}")
+    return selected_wallet
+
+def unlock_wallet(session_name, selected_wallet, wallet_password):
+    """Opens the wallet in the CLI and enters its password; returns True on success"""
+    # Open the selected wallet with the correct 'wallet open' command format
+    if selected_wallet == "kaspa" or selected_wallet == "default":
+        # Use wallet open command with default wallet
+        wallet_open_cmd = "wallet open"
+    else:
+        # Specify the wallet name
+        wallet_open_cmd = f"wallet open {selected_wallet}"
+    
+    ui(f"\n🔐 Opening wallet using command: {wallet_open_cmd}")
+    wallet_open_result = tmux_send_command_with_pattern(
+        session_name,
+        wallet_open_cmd,
+        "Enter wallet password:",
+        15,
+        success_message="✅ Wallet opening initiated"
+    )
+    if wallet_open_result is None:
+        logger.error("❌ Failed to open wallet")
+        return False
+    
+    logger.info("Entering wallet password...")
+    wallet_output = tmux_send_command_with_pattern(
+        session_name,
+        wallet_password,
+        "Your wallet hint is:",
+        password=True,
+        success_message="✅ Wallet password accepted"
+    )
+    if wallet_output is None:
+        logger.error("❌ Failed to enter wallet password")
+        return False
+    return True
+
+def close_cli(session_name):
+    """Exits the Kaspa CLI, before the tmux session is closed"""
+    ui("\nClosing Kaspa CLI...")
+    tmux_send_command_with_pattern(
+        session_name,
+        "exit",
+        "bye!",
+        5,
+        success_message="✅ Kaspa CLI closed successfully"
+    )
+
+def check_balance(session_name, currency_symbol, total_with_fees, assume_yes=False, allow_insufficient=False):
+    """
+    Compares the wallet balance with the total to send and asks for confirmation (unless assume_yes).
+    Without confirmation, an insufficient balance cancels the transfers unless allow_insufficient.
+    Returns True to proceed with the transfers.
+    """
+    # Get wallet balance
+    logger.info("Retrieving wallet balance...")
+    balance = get_wallet_balance(session_name, currency_symbol)
+    
+    if balance is None:
+        logger.error("❌ Unable to retrieve wallet balance")
+        return False
+    
+    # Compare balance and total amount
+    ui(f"\n💰 Current balance: {balance} {currency_symbol}")
+    logger.info(f"✅ Wallet balance retrieved successfully")
+    
+    if balance < total_with_fees:
+        shortfall = total_with_fees - balance
+        ui(f"\n⚠️ INSUFFICIENT BALANCE! Missing {shortfall:.8f} {currency_symbol} to make all transfers.", logging.WARNING)
+        question = "Balance is insufficient. Do you want to continue with possible transfers anyway? (y/n): "
+        if assume_yes and not allow_insufficient:
+            ui("❌ Transfers cancelled: --yes does not continue with an insufficient balance "
+               "(add --allow-insufficient-balance to send the possible transfers anyway)", logging.ERROR)
+            close_cli(session_name)
+            return False
+    else:
+        excess = balance - total_with_fees
+        # Use only one output method to avoid duplication
+        ui(f"\n✅ SUFFICIENT BALANCE! About {excess:.8f} {currency_symbol} will remain after transfers.")
+        question = "Do you want to proceed with transfers? (y/n): "
+    
+    if assume_yes:
+        confirm = 'y'
+    else:
+        confirm = input(question).strip().lower()
+    if confirm != 'y':
+        logger.info("Operation cancelled by user.")
+        close_cli(session_name)
+        return False
+    return True
+
+def run_transfers(session_name, transfers, wallet_password, payment_password, currency_symbol, ledger_path, already_sent):
+    """
+    Sends the transfers, then verifies their reception as one batch.
+    Returns (successful, pending, failed, error counts by type, first error details, pending rows for the recovery file).
+    """
+    # Perform transfers
+    print("\n📤 Starting transfers...")
+    successful_transfers = 0
+    pending_transfers = 0  # Transactions qui ont été envoyées mais non confirmées
+    
+    # Phase 1: tous les envois à la suite; phase 2: vérification groupée des réceptions
+    sent_transfers, failed_transfers, error_counts, error_details, last_send_time = send_transfers(
+        session_name,
+        transfers,
+        wallet_password,
+        payment_password,
+        currency_symbol,
+        ledger_path,
+        already_sent
+    )
+    ui(f"Transfer ledger written to {ledger_path}")
+    
+    # Vérifier la réception de tous les transferts envoyés
+    verified = set()
+    if sent_transfers:
+        print(f"⏳ Vérifiant la réception de {len(sent_transfers)} transferts...")
+        # Le délai initial ne court qu'à partir du dernier envoi, les premiers ont déjà eu le temps d'être propagés
+        initial_delay = max(0, last_send_time + TRANSACTION_CHECK_INITIAL_DELAY - time.time())
+        verified = verify_transactions_batch(
+            {i: (address, amount, amount_sompi, tx_id) for i, address, amount, amount_sompi, tx_id in sent_transfers},
+            initial_delay=initial_delay
+        )
+    
+    # Collecter les résultats des vérifications
+    pending_rows = []  # (adresse, montant) des transactions non confirmées, pour le fichier de récupération
+    for i, address, amount, _, tx_id in sent_transfers:
+        tx_info = f"(TX ID: {tx_id})" if tx_id else ""
+        if i in verified:
+            ui(f"✅ Transaction vérifiée: {amount} {currency_symbol} → {address} {tx_info}")
+            successful_transfers += 1
+        else:
+            ui(f"⚠️ Transaction potentiellement échouée: {amount} {currency_symbol} → {address} {tx_info}", logging.WARNING)
+            record_error(error_counts, error_details, "Transaction potentiellement échouée",
+                         f"Transfer #{i+1}: Transaction potentiellement échouée vers {address}")
+            pending_rows.append((address, amount))
+            pending_transfers += 1
+    
+    return successful_transfers, pending_transfers, failed_transfers, error_counts, error_details, pending_rows
+
+def write_report(successful_transfers, pending_transfers, failed_transfers, error_counts, error_details, pending_rows):
+    """Writes the recovery file for the unconfirmed transfers and displays the transfer summary"""
+    # Créer un fichier de récupération pour les transactions potentiellement échouées
+    if pending_transfers > 0:
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        pending_file = f"pending_transactions_{timestamp}.txt"
+        
+        buffer = io.StringIO()
+        buffer.write("================================================================================\n")
+        buffer.write("TRANSACTIONS POTENTIELLEMENT ÉCHOUÉES - À VÉRIFIER MANUELLEMENT\n")
+        buffer.write("================================================================================\n")
+        buffer.write("Address,Amount\n")
         
-        print(f"\n✅ Selected wallet: {selected_wallet}")
-        logger.info(f"Selected wallet: {selected_wallet}")
+        # Les transactions en attente ont été relevées pendant la collecte: une ligne par transfert,
+        # au format du fichier de redistribution pour pouvoir le relancer tel quel
+        csv.writer(buffer, lineterminator='\n').writerows(pending_rows)
+        
+        buffer.write(f"\n{REDISTRIBUTION_FOOTER}\n")
+        
+        # Écriture en une fois dans un fichier temporaire renommé ensuite: jamais de fichier tronqué
+        with open(pending_file + ".tmp", 'w', newline='') as f:
+            f.write(buffer.getvalue())
+        os.replace(pending_file + ".tmp", pending_file)
+        
+        ui(f"\n⚠️ Un fichier '{pending_file}' a été créé pour les transactions potentiellement échouées.")
+    
+    # Display transfer summary
+    ui(f"\n📊 Transfer summary: {successful_transfers} successful, {pending_transfers} pending, {failed_transfers} failed")
+    
+    # Display error details if any
+    if error_details:
+        ui("\nDetails of encountered errors:")
+        for error in error_details:
+            ui(f"  - {error}")
+        
+        # Au-delà des premières erreurs, seulement le nombre par type (chaque erreur est dans le fichier de log)
+        hidden_errors = sum(error_counts.values()) - len(error_details)
+        if hidden_errors:
+            ui(f"  ... and {hidden_errors} more, see {LOG_FILENAME}")
+            ui("\nErrors by type:")
+            for kind, count in error_counts.most_common():
+                ui(f"  - {kind}: {count}")
+
+def automate_kaspa_transfers(args):
+    """Automates Kaspa transfers via CLI interface"""
+    # Ask user to choose network
+    network_choice = args.network
+    while network_choice is None:
+        network_choice = input("Choose network (mainnet/testnet): ").strip().lower()
+        if network_choice not in ["mainnet", "testnet"]:
+            print("Please enter 'mainnet' or 'testnet'.")
+            network_choice = None
+    
+    # Load network configuration
+    network_config = NETWORK_CONFIGS[network_choice]
+    currency_symbol = network_config["currency_symbol"]
+    address_prefix = network_config["address_prefix"]
+    logger.info(f"Selected network: {network_choice}")
+    
+    # Check if redistribution file exists
+    if not os.path.exists(REDISTRIBUTION_FILE):
+        logger.error(f"The file {REDISTRIBUTION_FILE} does not exist!")
+        return
+    
+    # Read redistribution file
+    transfers = read_redistribution_file(REDISTRIBUTION_FILE, address_prefix)
+    if not transfers:
+        logger.warning(f"No transfers to make for network {network_choice}. Check the redistribution file.")
+        return
+    
+    # Reprise d'un lot interrompu: ignorer les transferts que le journal indique comme envoyés,
+    # seulement s'ils correspondent toujours à la même ligne du fichier de redistribution
+    already_sent = set()
+    if args.resume:
+        if not os.path.exists(args.resume):
+            logger.error(f"The ledger file {args.resume} does not exist!")
+            return
+        for i, (address, amount) in read_ledger(args.resume).items():
+            if i < len(transfers) and transfers[i][:2] == (address, amount):
+                already_sent.add(i)
+            else:
+                logger.warning(f"Ledger entry #{i+1} ({address}, {amount}) does not match the redistribution file, not skipped")
+        ui(f"Resuming from {args.resume}: {len(already_sent)} transfers already sent will be skipped")
+        ledger_path = args.resume
+    else:
+        ledger_path = f"ledger_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl"
+    
+    if len(already_sent) == len(transfers):
+        logger.warning(f"All transfers are already recorded as sent in {ledger_path}.")
+        return
+    
+    # Calculate total amount to transfer
+    total_amount, total_with_fees = calculate_total_amount([t for i, t in enumerate(transfers) if i not in already_sent])
+    logger.info(f"Found {len(transfers) - len(already_sent)} transfers to make for a total of {total_amount} {currency_symbol}")
+    logger.info(f"Estimated total with fees: {total_with_fees} {currency_symbol}")
+    
+    # Check if tmux is installed
+    try:
+        subprocess.run(["tmux", "-V"], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except:
+        logger.error("tmux is not installed. Please install it with: sudo apt-get install tmux")
+        return
+    
+    # tmux session name
+    session_name = f"kaspa_auto_{int(time.time())}"
+    
+    try:
+        # Create a new detached tmux session
+        logger.info("Creating a tmux session for Kaspa CLI...")
+        subprocess.run(["tmux", "new-session", "-d", "-s", session_name], check=True)
+        open_pane_output_stream(session_name)
+        logger.info("✅ Tmux session created successfully")
+        
+        if not connect_node(session_name, network_choice, network_config):
+            return
+        
+        selected_wallet = select_wallet(session_name, args.wallet)
         
         # Request passwords securely AFTER wallet selection
         print("\n🔑 Entering wallet credentials:")
-        wallet_password = getpass.getpass("Enter wallet password: ")
-        payment_password = getpass.getpass("Enter payment password (leave empty if same): ")
+        wallet_password = read_password(args.wallet_password_env, "Enter wallet password: ")
+        if args.wallet_password_env in os.environ and args.payment_password_env not in os.environ:
+            payment_password = ""  # Exécution sans invite: même mot de passe que le portefeuille
+        else:
+            payment_password = read_password(args.payment_password_env, "Enter payment password (leave empty if same): ")
         
         # If payment password is empty, use wallet password
         if not payment_password:
             payment_password = wallet_password
         
-        # Open the selected wallet with the correct 'wallet open' command format
-        if selected_wallet == "kaspa" or selected_wallet == "default":
-            # Use wallet open command with default wallet
-            wallet_open_cmd = "wallet open"
-        else:
-            # Specify the wallet name
-            wallet_open_cmd = f"wallet open {selected_wallet}"
-        
-        print(f"\n🔐 Opening wallet using command: {wallet_open_cmd}")
-        logger.info("Opening wallet...")
-        wallet_open_result = tmux_send_command_with_pattern(
-            session_name, 
-            wallet_open_cmd, 
-            "Enter wallet password:", 
-            15,
-            success_message="✅ Wallet opening initiated"
-        )
-        if wallet_open_result is None:
-            logger.error("❌ Failed to open wallet")
-            logger.info("Closing tmux session...")
-            subprocess.run(f'tmux kill-session -t {session_name}', shell=True, check=True)
-            return
-            
-        logger.info("Entering wallet password...")
-        wallet_output = tmux_send_command_with_pattern(
-            session_name, 
-            wallet_password, 
-            "Your wallet hint is:", 
-            password=True,
-            success_message="✅ Wallet password accepted"
-        )
-        if wallet_output is None:
-            logger.error("❌ Failed to enter wallet password")
-            logger.info("Closing tmux session...")
-            subprocess.run(f'tmux kill-session -t {session_name}', shell=True, check=True)
+        if not unlock_wallet(session_name, selected_wallet, wallet_password):
             return
         
-        # Get wallet balance
-        logger.info("Retrieving wallet balance...")
-        balance = get_wallet_balance(session_name, network_config["currency_symbol"])
-        
-        if balance is None:
-            logger.error("❌ Unable to retrieve wallet balance")
-            logger.info("Closing tmux session...")
-            subprocess.run(f'tmux kill-session -t {session_name}', shell=True, check=True)
-            logger.info("✅ Tmux session closed successfully")
+        if not check_balance(session_name, currency_symbol, total_with_fees, args.yes, args.allow_insufficient_balance):
             return
         
-        # Compare balance and total amount
-        print(f"\n💰 Current balance: {balance} {network_config['currency_symbol']}")
-        logger.info(f"Current balance: {balance} {network_config['currency_symbol']}")
-        logger.info(f"✅ Wallet balance retrieved successfully")
-        
-        if balance < total_with_fees:
-            shortfall = total_with_fees - balance
-            print(f"\n⚠️ INSUFFICIENT BALANCE! Missing {shortfall:.8f} {network_config['currency_symbol']} to make all transfers.")
-            logger.warning(f"⚠️ INSUFFICIENT BALANCE! Missing {shortfall:.8f} {network_config['currency_symbol']} to make all transfers.")
-            
-            confirm = input("Balance is insufficient. Do you want to continue with possible transfers anyway? (y/n): ").strip().lower()
-            if confirm != 'y':
-                logger.info("Operation cancelled by user.")
-                logger.info("Closing Kaspa CLI...")
-                tmux_send_command_with_pattern(
-                    session_name, 
-                    "exit", 
-                    "bye!", 
-                    5,
-                    success_message="✅ Kaspa CLI closed successfully"
-                )
-                logger.info("Closing tmux session...")
-                subprocess.run(f'tmux kill-session -t {session_name}', shell=True, check=True)
-                logger.info("✅ Tmux session closed successfully")
-                return
-        else:
-            excess = balance - total_with_fees
-            # Use only one output method to avoid duplication
-            print(f"\n✅ SUFFICIENT BALANCE! About {excess:.8f} {network_config['currency_symbol']} will remain after transfers.")
-            
-            confirm = input("Do you want to proceed with transfers? (y/n): ").strip().lower()
-            if confirm != 'y':
-                logger.info("Operation cancelled by user.")
-                logger.info("Closing Kaspa CLI...")
-                tmux_send_command_with_pattern(
-                    session_name, 
-                    "exit", 
-                    "bye!", 
-                    5,
-                    success_message="✅ Kaspa CLI closed successfully"
-                )
-                logger.info("Closing tmux session...")
-                subprocess.run(f'tmux kill-session -t {session_name}', shell=True, check=True)
-                logger.info("✅ Tmux session closed successfully")
-                return
-        
-        # Perform transfers
-        print("\n📤 Starting transfers...")
-        successful_transfers = 0
-        failed_transfers = 0
-        pending_transfers = 0  # Transactions qui ont été envoyées mais non confirmées
-        error_details = []  # List to store error details
-        
-        for i, (address, amount) in enumerate(transfers):
-            # Use only one output method for transfer start message
-            print(f"[{i+1}/{len(transfers)}] Sending {amount} {network_config['currency_symbol']} to {address}")
-            
-            # Utiliser le mécanisme de retry pour les transferts
-            output, error = attempt_transfer(
-                session_name, 
-                address, 
-                amount, 
-                wallet_password, 
-                payment_password,
-                network_config['currency_symbol']
-            )
-            
-            if output is not None:  # Transfert réussi
-                # Try to extract transaction ID
-                tx_id = extract_transaction_id(output)
-                tx_info = f"(TX ID: {tx_id})" if tx_id else ""
-                
-                # Attendre que la transaction soit confirmée
-                print(f"⏳ Vérifiant la réception de {amount} {network_config['currency_symbol']} par {address}...")
-                
-                # Ajout d'un délai avant de vérifier la transaction
-                time.sleep(5)
-                
-                # Vérifier si la transaction a été reçue
-                transaction_confirmed = verify_transaction_received(address, amount)
-                
-                if transaction_confirmed:
-                    print(f"✅ Transaction vérifiée: {amount} {network_config['currency_symbol']} → {address} {tx_info}")
-                    logger.info(f"✅ Transaction vérifiée: {amount} {network_config['currency_symbol']} → {address} {tx_info}")
-                    successful_transfers += 1
-                else:
-                    print(f"⚠️ Transaction potentiellement échouée: {amount} {network_config['currency_symbol']} → {address} {tx_info}")
-                    logger.warning(f"⚠️ Transaction potentiellement échouée: {amount} {network_config['currency_symbol']} → {address} {tx_info}")
-                    error_details.append(f"Transfer #{i+1}: Transaction potentiellement échouée vers {address}")
-                    pending_transfers += 1
-            else:  # Transfert échoué
-                print(f"❌ Échec du transfert: {amount} {network_config['currency_symbol']} → {address} - {error}")
-                logger.error(f"❌ Échec du transfert: {amount} {network_config['currency_symbol']} → {address} - {error}")
-                error_details.append(f"Transfer #{i+1}: {error}")
-                failed_transfers += 1
-                
-                # Si l'erreur indique un manque de fonds global et non local à la transaction
-                if error and "not enough funds" in error.lower() and "Insufficient funds" not in error:
-                    print(f"❌ Arrêt des transferts - fonds globalement insuffisants")
-                    logger.error(f"❌ Arrêt des transferts - fonds globalement insuffisants")
-                    break
-            
-            # Short pause between transfers
-            time.sleep(3)
-        
-        # Créer un fichier de récupération pour les transactions potentiellement échouées
-        if pending_transfers > 0:
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            pending_file = f"pending_transactions_{timestamp}.txt"
-            
-            with open(pending_file, 'w') as f:
-                f.write("================================================================================\n")
-                f.write("TRANSACTIONS POTENTIELLEMENT ÉCHOUÉES - À VÉRIFIER MANUELLEMENT\n")
-                f.write("================================================================================\n")
-                f.write("Address,Amount\n")
-                
-                # Trouver les transactions en attente en utilisant les détails d'erreur
-                for error in error_details:
-                    if "potentiellement échouée vers" in error:
-                        # Extraire l'adresse
-                        address_match = re.search(r'échouée vers (kaspa:[a-z0-9]+)', error)
-                        if address_match:
-                            address = address_match.group(1)
-                            # Trouver le montant correspondant
-                            for addr, amt in transfers:
-                                if addr == address:
-                                    f.write(f"{address},{amt}\n")
-                
-                f.write("\nEnd of redistribution report\n")
-            
-            print(f"\n⚠️ Un fichier '{pending_file}' a été créé pour les transactions potentiellement échouées.")
-            logger.info(f"Fichier '{pending_file}' créé pour les transactions potentiellement échouées.")
-        
-        # Display transfer summary
-        print(f"\n📊 Transfer summary: {successful_transfers} successful, {pending_transfers} pending, {failed_transfers} failed")
-        logger.info(f"Transfer summary: {successful_transfers} successful, {pending_transfers} pending, {failed_transfers} failed")
-        
-        # Display error details if any
-        if error_details:
-            print("\nDetails of encountered errors:")
-            logger.info("Details of encountered errors:")
-            for error in error_details:
-                print(f"  - {error}")
-                logger.info(f"  - {error}")
-        
-        # Close CLI and tmux session
-        print("\nClosing Kaspa CLI...")
-        logger.info("Closing Kaspa CLI...")
-        tmux_send_command_with_pattern(
-            session_name, 
-            "exit", 
-            "bye!", 
-            5, 
-            success_message="✅ Kaspa CLI closed successfully"
+        results = run_transfers(
+            session_name,
+            transfers,
+            wallet_password,
+            payment_password,
+            currency_symbol,
+            ledger_path,
+            already_sent
         )
-        print("Closing tmux session...")
-        logger.info("Closing tmux session...")
-        subprocess.run(f'tmux kill-session -t {session_name}', shell=True, check=True)
-        logger.info("✅ Tmux session closed successfully")
-        
-        print(f"\n✅ Script finished. Operation log available in {LOG_FILENAME}")
-        logger.info(f"Script finished. Operation log available in {LOG_FILENAME}")
+        write_report(*results)
         
+        # Close CLI, the tmux session is closed below
+        close_cli(session_name)
+    
     except Exception as e:
-        print(f"\n❌ Error: {e}")
-        logger.error(f"Error: {e}")
+        ui(f"\n❌ Error: {e}", logging.ERROR)
         logger.exception("Error details:")
-        
-        # Cleanup attempt in case of error
+        return
+    
+    finally:
+        # Une seule fermeture de la session pour toutes les sorties, réussite, échec d'une étape ou erreur
         try:
-            if 'session_name' in locals():
-                subprocess.run(f'tmux kill-session -t {session_name}', shell=True, check=True)
-        except:
-            pass
+            cleanup_session(session_name)
+        except (OSError, subprocess.CalledProcessError) as e:
+            logger.debug(f"tmux session cleanup failed: {e}")
+    
+    ui(f"\n✅ Script finished. Operation log available in {LOG_FILENAME}")
 
 if __name__ == "__main__":
+    args = parse_arguments()
+    LOG_FILENAME = configure_logging()
     logger.info("=== Starting Kaspa transfer automation script ===")
-    automate_kaspa_transfers()
\ No newline at end of file
+    automate_kaspa_transfers(args)